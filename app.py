@@ -1,11 +1,17 @@
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output
-from modules import market_sentiment, sector_leaders, top_50_stocks, risk_on_off
+import os
+from modules import market_sentiment, sector_leaders, top_50_stocks, risk_on_off, phase_breadth
+from modules import market_breadth
+from modules import figure_cache, live, metrics, scheduler
 
 # Skapa Dash-applikation
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 server = app.server  # För att kunna deploya på en server
+metrics.register_endpoint(server)  # Svarstider, cacheträffar och nedladdningar på /metrics
+figure_cache.register_endpoint(server)  # Cachade figurer som JSON med ETag på /figures
+figure_cache.enable_compression(server)  # brotli/gzip och 304 för oförändrade svar
 
 # 🔹 Huvudlayout med navigering
 app.layout = html.Div([
@@ -18,7 +24,12 @@ app.layout = html.Div([
         dcc.Link("🚀 Top 50 Stocks", href="/top_50_stocks", 
                  style={"padding": "20px", "fontSize": "18px"}),
         dcc.Link("⚠️ Risk On/Off", href="/risk_on_off", 
-                 style={"padding": "20px", "fontSize": "18px"})
+                 style={"padding": "20px", "fontSize": "18px"}),
+        dcc.Link("🧭 Fasbredd", href="/phase_breadth", 
+                 style={"padding": "20px", "fontSize": "18px"}),
+        dcc.Link("📉 Marknadsbredd", href="/market_breadth", 
+                 style={"padding": "20px", "fontSize": "18px"}),
+        html.Div(id="last-refresh", style={"fontSize": "12px", "color": "gray"})
     ], style={
         "textAlign": "center", 
         "marginBottom": "20px", 
@@ -31,22 +42,37 @@ app.layout = html.Div([
     html.Div(id="page-content")
 ])
 
+# 🔹 Sidor: sökväg -> (modul, namn). Layouterna byggs först när sidan besöks.
+PAGES = {
+    "/": (market_sentiment, "Market Sentiment"),
+    "/market_sentiment": (market_sentiment, "Market Sentiment"),
+    "/sector_leaders": (sector_leaders, "Sector Leaders"),
+    "/top_50_stocks": (top_50_stocks, "Top 50 Stocks"),
+    "/risk_on_off": (risk_on_off, "Risk On/Off"),
+    "/phase_breadth": (phase_breadth, "Fasbredd"),
+    "/market_breadth": (market_breadth, "Marknadsbredd"),
+}
+
 # 🔹 Callback för att växla mellan sidor
 @app.callback(
-    Output("page-content", "children"),
+    [Output("page-content", "children"),
+     Output("last-refresh", "children")],
     [Input("url", "pathname")]
 )
+@metrics.instrument("display_page")
 def display_page(pathname):
-    if pathname in ["/", "/market_sentiment"]:
-        return getattr(market_sentiment, "layout", html.H1("Market Sentiment saknas"))
-    elif pathname == "/sector_leaders":
-        return getattr(sector_leaders, "layout", html.H1("Sector Leaders saknas"))
-    elif pathname == "/top_50_stocks":
-        return getattr(top_50_stocks, "layout", html.H1("Top 50 Stocks saknas"))
-    elif pathname == "/risk_on_off":
-        return getattr(risk_on_off, "layout", html.H1("Risk On/Off saknas"))
+    refreshed = scheduler.last_refresh()
+    if refreshed is None:
+        refresh_text = "Data uppdateras vid behov"
     else:
-        return html.H1("❌ 404 - Sidan hittades inte", style={"textAlign": "center", "color": "red"})
+        refresh_text = f"Senast uppdaterad: {refreshed.tz_convert('Europe/Stockholm'):%Y-%m-%d %H:%M}"
+    if pathname not in PAGES:
+        return html.H1("❌ 404 - Sidan hittades inte", style={"textAlign": "center", "color": "red"}), refresh_text
+    module, name = PAGES[pathname]
+    if not hasattr(module, "get_layout"):
+        return html.H1(f"{name} saknas"), refresh_text
+    with metrics.span(f"layout:{pathname.strip('/') or 'market_sentiment'}"):
+        return module.get_layout(), refresh_text
 
 # 🔹 Registrera callbacks för de moduler som har egna callback-funktioner
 if hasattr(sector_leaders, "register_callbacks"):
@@ -55,6 +81,17 @@ if hasattr(top_50_stocks, "register_callbacks"):
     top_50_stocks.register_callbacks(app)
 if hasattr(risk_on_off, "register_callbacks"):
     risk_on_off.register_callbacks(app)
+if hasattr(phase_breadth, "register_callbacks"):
+    phase_breadth.register_callbacks(app)
+if hasattr(market_breadth, "register_callbacks"):
+    market_breadth.register_callbacks(app)
+
+# 🔹 Bakgrundsuppdatering av data och figurer (stängs av med MARKETBREADTH_SCHEDULER=0)
+if os.environ.get("MARKETBREADTH_SCHEDULER", "1") != "0":
+    scheduler.start()
+
+# 🔹 Liveläge med minutstaplar under handelsdagen (MARKETBREADTH_LIVE=1)
+live.start()
 
 if __name__ == "__main__":
     app.run_server(debug=True)
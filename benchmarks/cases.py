@@ -0,0 +1,43 @@
+from modules import datagraph, market_sentiment, risk_on_off, sector_leaders, top_50_stocks
+from modules.market_phase import process_market_phase
+
+# --------------------------------------------------
+# Mätfall: heta vägar i sidorna
+# --------------------------------------------------
+# Varje fall returnerar en figur (för att mäta JSON-storleken) eller None.
+# Fallen körs mot den syntetiska leverantören; se benchmarks/run.py.
+
+def fetch_top_stocks_data():
+    top_50_stocks.fetch_top_stocks_data("6M")
+
+def fetch_sector_data():
+    # De 70 sektor-ETF:erna, oberoende av universumets storlek
+    sector_leaders.fetch_sector_data("6M")
+
+def process_market_phase_qqq():
+    # Hela QQQ-historiken, utan sparat tillstånd
+    data = datagraph.get("qqq_phase")[["Close", "MA20", "Deviation"]].copy()
+    process_market_phase(data)
+
+def create_candlestick_chart():
+    data = datagraph.get("qqq_phase").reset_index()
+    return market_sentiment.create_candlestick_chart(data)
+
+def update_risk_indicator():
+    # Det callbacken gör när bakgrundsjobbet inte har något resultat
+    fig, _, _ = risk_on_off.compute_risk_indicator()
+    return fig
+
+CASES = {
+    "fetch_top_stocks_data": fetch_top_stocks_data,
+    "fetch_sector_data": fetch_sector_data,
+    "process_market_phase": process_market_phase_qqq,
+    "create_candlestick_chart": create_candlestick_chart,
+    "update_risk_indicator": update_risk_indicator,
+}
+
+# Data som ett fall behöver, men som inte ska ingå i mätningen
+SETUP = {
+    "process_market_phase": lambda: datagraph.get("qqq_phase"),
+    "create_candlestick_chart": lambda: datagraph.get("qqq_phase"),
+}
@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+# --------------------------------------------------
+# Benchmarks för hämtning, beräkning och figurbygge
+# --------------------------------------------------
+# Körs helt offline mot den syntetiska leverantören:
+#
+#   python -m benchmarks.run                      # standardrutnät, jämför mot baselines.json
+#   python -m benchmarks.run --quick              # 500 aktier, 1 år
+#   python -m benchmarks.run --tickers 3000 --years 20
+#   python -m benchmarks.run --update-baselines   # spara nya referensvärden
+#
+# För varje storlek (antal aktier i universumet × år historik) fylls en tillfällig
+# prisdatabas och de sparade tabellerna (indikatorer, faser, bredd) i en egen
+# process. Därefter körs varje fall i en ny process, som vid en omstart av
+# servern: data finns på disk men inget är laddat i minnet. Uppdateringskontrollen
+# mot leverantören görs före mätningen (se _warm), så tiderna beror inte på veckodag.
+# Rapporten innehåller väggtid, högsta minnesanvändning (tracemalloc, i en
+# separat körning) och storleken på figurens JSON. Fall som blivit långsammare eller större än
+# baslinjen (med marginal) flaggas och ger returkod 1.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_GRID = [(500, 1), (500, 5), (500, 20), (3000, 1), (3000, 20)]
+QUICK_GRID = [(500, 1)]
+TIME_TOLERANCE = 0.5      # Tillåten ökning av väggtid (50 %, mätningar brusar)
+MEMORY_TOLERANCE = 0.25   # Tillåten ökning av minnestopp
+MEMORY_SLACK_MB = 2.0     # Små fall: absolut marginal
+SIZE_TOLERANCE = 0.10     # Tillåten ökning av figurens JSON-storlek
+
+#############################
+# Körs i barnprocesser
+#############################
+
+def _tickers():
+    from modules import sector_leaders
+    from modules.constituents import get_sp500_tickers
+    from modules.risk_score import SECTOR_ETFS
+    tickers = get_sp500_tickers() + sector_leaders.SECTOR_TICKERS + ["QQQ", "^VIX"] + SECTOR_ETFS
+    return list(dict.fromkeys(tickers))
+
+def _prepare():
+    from modules import datagraph, price_store
+    price_store.update_prices(_tickers())
+    datagraph.get("risk_components")
+
+def _warm():
+    # Under en handelsdag är dagens stapel inte avslutad och skulle hämtas om
+    # inne i mätningen; efter kontrollen här hoppas tickers över i REFRESH_INTERVAL
+    from modules import price_store
+    price_store.update_prices(_tickers())
+
+def _run_case(name, memory):
+    # Tid och minne mäts i olika processer: tracemalloc gör Python-tung kod långsammare
+    from benchmarks.cases import CASES, SETUP
+    _warm()
+    if name in SETUP:
+        SETUP[name]()
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    fig = CASES[name]()
+    seconds = time.perf_counter() - start
+    if memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("RESULT " + json.dumps({"peak_mb": peak / 2**20}))
+        return
+    json_kb = len(fig.to_json()) / 1024 if fig is not None else None
+    print("RESULT " + json.dumps({"seconds": seconds, "json_kb": json_kb}))
+
+#############################
+# Huvudprocess
+#############################
+
+def _environment(data_dir, tickers, years):
+    env = dict(os.environ)
+    env.update({
+        "MARKETBREADTH_PROVIDER": "synthetic",
+        "MARKETBREADTH_SYNTHETIC_TICKERS": str(tickers),
+        "MARKETBREADTH_SYNTHETIC_YEARS": str(years),
+        "MARKETBREADTH_DATA_DIR": data_dir,
+        "MARKETBREADTH_SCHEDULER": "0",
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")])),
+    })
+    return env
+
+def _child(args, env):
+    process = subprocess.run([sys.executable, "-m", "benchmarks.run"] + args, env=env, cwd=ROOT,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "okänt fel")
+    for line in process.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    return None
+
+def run_benchmarks(grid, cases):
+    results = {}
+    for tickers, years in grid:
+        print(f"⏱️ {tickers} aktier, {years} år historik...")
+        with tempfile.TemporaryDirectory(prefix="marketbreadth-bench-") as data_dir:
+            env = _environment(data_dir, tickers, years)
+            start = time.perf_counter()
+            _child(["--prepare"], env)
+            print(f"   Data förberedd på {time.perf_counter() - start:.1f} s")
+            for case in cases:
+                key = f"{case}@{tickers}x{years}y"
+                try:
+                    results[key] = _child(["--case", case], env)
+                    results[key].update(_child(["--case", case, "--memory"], env))
+                except RuntimeError as e:
+                    print(f"❌ {key}: {e}")
+                    continue
+                result = results[key]
+                size = f"{result['json_kb']:.0f} kB" if result["json_kb"] is not None else "-"
+                print(f"   {case:<26} {result['seconds']:8.3f} s {result['peak_mb']:8.1f} MB {size:>10}")
+    return results
+
+def compare(results, baselines):
+    """Fall som blivit sämre än baslinjen: lista av (nyckel, beskrivning)."""
+    regressions = []
+    for key, result in results.items():
+        base = baselines.get(key)
+        if base is None:
+            continue
+        if result["seconds"] > base["seconds"] * (1 + TIME_TOLERANCE):
+            regressions.append((key, f"tid {base['seconds']:.3f} -> {result['seconds']:.3f} s"))
+        if result["peak_mb"] > base["peak_mb"] * (1 + MEMORY_TOLERANCE) + MEMORY_SLACK_MB:
+            regressions.append((key, f"minne {base['peak_mb']:.1f} -> {result['peak_mb']:.1f} MB"))
+        if result["json_kb"] is not None and base.get("json_kb") is not None \
+                and result["json_kb"] > base["json_kb"] * (1 + SIZE_TOLERANCE):
+            regressions.append((key, f"figur {base['json_kb']:.0f} -> {result['json_kb']:.0f} kB"))
+    return regressions
+
+def main(argv=None):
+    from benchmarks.cases import CASES
+    parser = argparse.ArgumentParser(description="Offline-benchmarks för Marketbreadth")
+    parser.add_argument("--tickers", type=int, nargs="+", help="Antal aktier i universumet")
+    parser.add_argument("--years", type=int, nargs="+", help="År historik")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--quick", action="store_true", help="Bara 500 aktier och 1 år")
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("--prepare", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--memory", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.prepare:
+        return _prepare()
+    if args.case:
+        return _run_case(args.case, args.memory)
+
+    if args.tickers or args.years:
+        grid = [(t, y) for t in (args.tickers or [500]) for y in (args.years or [1])]
+    else:
+        grid = QUICK_GRID if args.quick else DEFAULT_GRID
+    results = run_benchmarks(grid, args.cases)
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baselines = json.load(f)
+    if args.update_baselines:
+        baselines.update(results)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(dict(sorted(baselines.items())), f, indent=2)
+        print(f"✅ Sparade {len(results)} baslinjer i {BASELINE_PATH}")
+        return 0
+
+    regressions = compare(results, baselines)
+    for key, description in regressions:
+        print(f"⚠️ Försämring i {key}: {description}")
+    if not regressions:
+        print("✅ Inga försämringar mot baslinjen")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
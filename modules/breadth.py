@@ -0,0 +1,191 @@
+import os
+import numpy as np
+import pandas as pd
+from modules import price_store, table_store, universes
+from modules.constituents import get_sp500_tickers, universe_version
+
+#############################
+# Marknadsbredd för ett universum (t.ex. S&P 500)
+#############################
+# Räknar fram stigande/fallande aktier, A/D-linjen, andel över MA20/MA50/MA200,
+# nya 52-veckors toppar/bottnar och McClellan-oscillatorn/summeringsindex över hela prismatrisen med
+# vektoriserade rullande operationer. Historiken beräknas en gång och sparas;
+# därefter räknas bara nya dagar fram.
+
+BREADTH_DIR = os.path.join(price_store.DATA_DIR, "breadth")
+MA_WINDOWS = (20, 50, 200)
+NH_NL_WINDOW = 252            # 52 veckor
+TAIL_ROWS = max(MA_WINDOWS + (NH_NL_WINDOW,))  # Rader som behövs före en ny dag
+SCHEMA_VERSION = 3            # Ökas när kolumnerna (eller indata) ändras, så att sparad historik byggs om
+MCCLELLAN_FAST = 0.10         # EMA ~19 dagar
+MCCLELLAN_SLOW = 0.05         # EMA ~39 dagar
+
+_universe_tables = {}         # universum -> (dataversion, breddtabell), för sidorna
+
+def _daily_sums(closes):
+    # Antal per dag; summor kan adderas mellan block av tickers
+    changes = closes.diff()
+    sums = pd.DataFrame(index=closes.index)
+    sums["Advances"] = (changes > 0).sum(axis=1)
+    sums["Declines"] = (changes < 0).sum(axis=1)
+    sums["Unchanged"] = (changes == 0).sum(axis=1)
+    for window in MA_WINDOWS:
+        ma = closes.rolling(window=window).mean()
+        sums[f"Above MA{window}"] = (closes > ma).sum(axis=1)
+        sums[f"Counted MA{window}"] = ma.notna().sum(axis=1)
+    sums["New Highs"], sums["New Lows"] = compute_new_highs_lows(closes)
+    return sums
+
+def _counts_from_sums(sums):
+    # Allt som inte beror på tidigare värden i själva breddserien
+    table = sums[["Advances", "Declines", "Unchanged"]].copy()
+    table["Net Advances"] = table["Advances"] - table["Declines"]
+    for window in MA_WINDOWS:
+        counted = sums[f"Counted MA{window}"]
+        table[f"Above MA{window} (%)"] = (sums[f"Above MA{window}"] / counted.where(counted > 0)) * 100
+    table["New Highs"] = sums["New Highs"]
+    table["New Lows"] = sums["New Lows"]
+    table["NH-NL"] = table["New Highs"] - table["New Lows"]
+    return table
+
+def _daily_counts(closes):
+    return _counts_from_sums(_daily_sums(closes))
+
+def _chunked_counts(tickers, start=None):
+    # Samma som _daily_counts för hela universumet, men ett block tickers i taget
+    total = None
+    for block in universes.chunks(tickers):
+        closes = price_store.get_panel(block, ["Close"], start=start, refresh=False).frame("Close")
+        sums = _daily_sums(closes)
+        total = sums if total is None else total.add(sums, fill_value=0)
+    if total is None:
+        total = _daily_sums(pd.DataFrame(dtype=float))   # Tomt universum
+    return _counts_from_sums(total.sort_index().astype(int))
+
+def compute_new_highs_lows(closes, window=NH_NL_WINDOW):
+    """
+    Antal tickers per dag som stänger på ny högsta/lägsta nivå för de senaste
+    window dagarna (dagens stängning inräknad). Kräver full fönsterhistorik.
+    """
+    rolling_max = closes.rolling(window=window).max()
+    rolling_min = closes.rolling(window=window).min()
+    new_highs = (closes >= rolling_max).sum(axis=1)
+    new_lows = (closes <= rolling_min).sum(axis=1)
+    return new_highs, new_lows
+
+def _add_cumulative(table, ad_start=0.0, fast_start=None, slow_start=None, summation_start=0.0):
+    net = table["Net Advances"].astype(float)
+    table["AD Line"] = ad_start + net.cumsum()
+    # EMA med adjust=False kan fortsätta från sparat värde: lägg till startvärdet först
+    if fast_start is None:
+        fast = net.ewm(alpha=MCCLELLAN_FAST, adjust=False).mean()
+        slow = net.ewm(alpha=MCCLELLAN_SLOW, adjust=False).mean()
+    else:
+        fast = pd.concat([pd.Series([fast_start]), net]).ewm(alpha=MCCLELLAN_FAST, adjust=False).mean().iloc[1:]
+        slow = pd.concat([pd.Series([slow_start]), net]).ewm(alpha=MCCLELLAN_SLOW, adjust=False).mean().iloc[1:]
+        fast.index = slow.index = table.index
+    table["EMA Fast"] = fast
+    table["EMA Slow"] = slow
+    table["McClellan Oscillator"] = fast - slow
+    table["McClellan Summation"] = summation_start + table["McClellan Oscillator"].cumsum()
+    return table
+
+def compute_breadth(closes):
+    """Full breddhistorik för en prismatris (datum × tickers)."""
+    return _add_cumulative(_daily_counts(closes))
+
+def _path(name):
+    return os.path.join(BREADTH_DIR, f"{name}.parquet")
+
+def _load(name):
+    return table_store.load(_path(name))
+
+def _save(name, table, meta):
+    table_store.save(_path(name), table, meta)
+
+def _row_signature(closes):
+    # Senaste radens kurser, för att se om dagens stapel ändrats sedan förra körningen
+    return closes.iloc[-1].fillna(-1).round(6).tolist()
+
+def update_breadth(name, closes, universe_key):
+    """
+    Returnerar breddtabellen för closes. Sparad historik återanvänds om
+    universumet är detsamma; då räknas bara senast sparade dag (som kan ha
+    sparats under handelsdagen) och dagarna efter den om.
+    """
+    table, meta = _load(name)
+    if table is not None and meta.get("universe") == universe_key \
+            and meta.get("schema") == SCHEMA_VERSION and len(table) >= 2:
+        redo = closes.index >= table.index[-1]
+        if not redo.any():
+            return table
+        position = int(np.argmax(redo))
+        if position >= TAIL_ROWS:
+            signature = _row_signature(closes)
+            if position == len(closes) - 1 and meta.get("last_row") == signature:
+                return table   # Inget nytt sedan förra beräkningen
+            kept = table.iloc[:-1]
+            new = _daily_counts(closes.iloc[position - TAIL_ROWS:]).iloc[TAIL_ROWS:]
+            last = kept.iloc[-1]
+            new = _add_cumulative(new, last["AD Line"], last["EMA Fast"], last["EMA Slow"],
+                                  last["McClellan Summation"])
+            table = pd.concat([kept, new])
+            meta["last_row"] = signature
+            _save(name, table, meta)
+            return table
+    table = compute_breadth(closes)
+    _save(name, table, {"universe": universe_key, "schema": SCHEMA_VERSION,
+                        "last_row": _row_signature(closes)})
+    return table
+
+def get_sp500_breadth():
+    """Breddtabell för S&P 500 från prisdatabasen (uppdateras inkrementellt)."""
+    tickers = get_sp500_tickers()
+    closes = price_store.get_panel(tickers, ["Close"]).frame("Close")
+    return update_breadth("sp500", closes, universe_version())
+
+def update_universe_breadth(name, universe_key=None):
+    """
+    Breddtabell för ett universum från modules/universes, beräknad i block om
+    universes.CHUNK_TICKERS tickers så att minnet inte växer med universumet.
+    Efter första beräkningen räknas bara senast sparade dag och dagarna efter
+    den om, med TAIL_ROWS rader historik före.
+    """
+    tickers = universes.get_universe(name)
+    universe_key = universe_key or universes.universe_version(name)
+    for block in universes.chunks(tickers):
+        price_store.update_prices(block)
+    table, meta = _load(name)
+    if table is not None and meta.get("universe") == universe_key \
+            and meta.get("schema") == SCHEMA_VERSION and len(table) > TAIL_ROWS:
+        counts = _chunked_counts(tickers, start=table.index[-1 - TAIL_ROWS])
+        new = counts[counts.index >= table.index[-1]]
+        if new.empty:
+            return table
+        if len(new) == 1 and new.iloc[0].equals(table[new.columns].iloc[-1]):
+            return table   # Inget nytt sedan förra beräkningen
+        kept = table.iloc[:-1]
+        last = kept.iloc[-1]
+        new = _add_cumulative(new.copy(), last["AD Line"], last["EMA Fast"], last["EMA Slow"],
+                              last["McClellan Summation"])
+        table = pd.concat([kept, new])
+        _save(name, table, meta)
+        return table
+    table = _add_cumulative(_chunked_counts(tickers))
+    _save(name, table, {"universe": universe_key, "schema": SCHEMA_VERSION})
+    return table
+
+def get_universe_breadth(name):
+    """
+    Breddtabell för ett universum från modules/universes (för sidorna), cachad
+    per dataversion. S&P 500 hämtas via datagraph ("sp500_breadth").
+    """
+    for block in universes.chunks(universes.get_universe(name)):
+        price_store.update_prices(block)
+    version = (price_store.get_version(), universes.universe_version(name))
+    cached = _universe_tables.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    table = update_universe_breadth(name, version[1])
+    _universe_tables[name] = (version, table)
+    return table
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import pandas as pd
+from modules import metrics, price_store, providers, scheduler
+
+# --------------------------------------------------
+# S&P 500-medlemmar: daterade ögonblicksbilder på disk
+# --------------------------------------------------
+# Listan skrapas från Wikipedia och sparas som data/constituents/sp500_ÅÅÅÅ-MM-DD.json.
+# Vid start läses senaste ögonblicksbilden från disk; skrapning sker bara när
+# ingen bild finns eller när bakgrundsjobbet ser att den senaste är för gammal.
+
+SNAPSHOT_DIR = os.path.join(price_store.DATA_DIR, "constituents")
+SNAPSHOT_MAX_AGE_DAYS = 7
+INDEX_NAME = "sp500"
+
+_current = None   # Senast laddade ögonblicksbild: {"index", "date", "tickers"}
+
+def scrape_sp500_tickers():
+    # Wikipedia via Yahoo-leverantören, eller replay/synthetic offline
+    metrics.count("upstream_requests_total", provider=providers.get_provider().name)
+    tickers = providers.get_provider().index_members(INDEX_NAME)
+    return tickers
+
+def _snapshot_path(date):
+    return os.path.join(SNAPSHOT_DIR, f"{INDEX_NAME}_{date}.json")
+
+def list_snapshots():
+    """Datum (ÅÅÅÅ-MM-DD) för sparade ögonblicksbilder, äldst först."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    prefix = f"{INDEX_NAME}_"
+    return sorted(name[len(prefix):-len(".json")] for name in os.listdir(SNAPSHOT_DIR)
+                  if name.startswith(prefix) and name.endswith(".json"))
+
+def load_snapshot(date=None):
+    """Läser en ögonblicksbild (senaste om date saknas). Returnerar None om ingen finns."""
+    if date is None:
+        dates = list_snapshots()
+        if not dates:
+            return None
+        date = dates[-1]
+    with open(_snapshot_path(date)) as f:
+        return json.load(f)
+
+def save_snapshot(tickers, date=None):
+    date = date or pd.Timestamp.today().strftime("%Y-%m-%d")
+    snapshot = {"index": INDEX_NAME, "date": date, "tickers": list(tickers)}
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = _snapshot_path(date)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+    return snapshot
+
+def diff_snapshots(old, new):
+    """Tillagda och borttagna tickers mellan två ögonblicksbilder."""
+    old_tickers = set(old["tickers"]) if old else set()
+    new_tickers = set(new["tickers"])
+    return {"added": sorted(new_tickers - old_tickers), "removed": sorted(old_tickers - new_tickers)}
+
+def refresh_constituents():
+    """Skrapar aktuell lista, sparar en ny ögonblicksbild och returnerar ändringarna."""
+    global _current
+    previous = load_snapshot()
+    snapshot = save_snapshot(scrape_sp500_tickers())
+    changes = diff_snapshots(previous, snapshot)
+    if previous is not None and (changes["added"] or changes["removed"]):
+        print(f"🔁 S&P 500 sedan {previous['date']}: +{changes['added']} -{changes['removed']}")
+    _current = snapshot
+    return changes
+
+def _snapshot_age_days(snapshot):
+    return (pd.Timestamp.today().normalize() - pd.Timestamp(snapshot["date"])).days
+
+def get_sp500_snapshot():
+    global _current
+    if _current is None:
+        _current = load_snapshot()
+    if _current is None:
+        if price_store.EXTERNAL_INGEST:
+            raise RuntimeError("Ingen S&P 500-lista ännu; starta ingest-processen (python -m modules.ingest)")
+        refresh_constituents()
+    return _current
+
+def get_sp500_tickers():
+    """Aktuella S&P 500-tickers från senaste ögonblicksbild (skrapas bara om ingen finns)."""
+    return get_sp500_snapshot()["tickers"]
+
+def universe_version():
+    """Stabil version av universumet: datum plus kort hash av tickerlistan."""
+    snapshot = get_sp500_snapshot()
+    digest = hashlib.sha1(",".join(snapshot["tickers"]).encode()).hexdigest()[:8]
+    return f"{snapshot['date']}-{digest}"
+
+def refresh_if_stale():
+    """Skrapar en ny lista om senaste ögonblicksbilden är för gammal (eller saknas)."""
+    global _current
+    if price_store.EXTERNAL_INGEST:
+        # Ingest-processen skrapar; läs om dess senaste ögonblicksbild
+        _current = load_snapshot()
+        return None
+    snapshot = _current or load_snapshot()
+    if snapshot is None or _snapshot_age_days(snapshot) >= SNAPSHOT_MAX_AGE_DAYS:
+        return refresh_constituents()
+    return None
+
+# Bakgrundsjobb: uppdatera listan när senaste ögonblicksbilden blivit för gammal
+scheduler.register_job("constituents", refresh_if_stale)
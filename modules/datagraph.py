@@ -0,0 +1,128 @@
+import threading
+from modules import metrics, price_store
+from modules.breadth import update_breadth
+from modules.constituents import get_sp500_tickers, universe_version
+from modules.indicators import update_indicator_table
+from modules.market_phase import update_market_phase
+from modules.trading_calendar import get_trading_calendar
+
+# --------------------------------------------------
+# Beroendegraf för delade mellanresultat
+# --------------------------------------------------
+# Namngivna noder (QQQ-historik, fastabell, S&P 500-matris, bredd, ...) beräknas
+# en gång per dataversion och delas mellan sidorna. En nod anger vilka noder
+# den bygger på och vilka tickers den läser; get() kontrollerar först att
+# tickers i hela delgrafen är aktuella (utan nätverksanrop om de redan är det)
+# och räknar sedan bara om de noder vars version är inaktuell.
+# Värdena delas mellan anropare och får inte ändras.
+
+_nodes = {}   # namn -> (funktion, beroenden, tickers)
+_memo = {}    # namn -> (version, värde)
+_lock = threading.Lock()      # Skyddar bara _memo och _node_locks
+_node_locks = {}              # namn -> lås; en nod räknas bara i en tråd åt gången
+
+def node(name, depends=(), tickers=()):
+    """Registrerar en nod. Funktionen får beroendenas värden som argument i samma ordning."""
+    def register(func):
+        _nodes[name] = (func, tuple(depends), tickers)
+        return func
+    return register
+
+def _subgraph(name, order=None):
+    # Noder i beräkningsordning: beroenden före noden själv
+    order = [] if order is None else order
+    if name in order:
+        return order
+    for dependency in _nodes[name][1]:
+        _subgraph(dependency, order)
+    order.append(name)
+    return order
+
+def _tickers(order):
+    tickers = []
+    for name in order:
+        node_tickers = _nodes[name][2]
+        tickers.extend(node_tickers() if callable(node_tickers) else node_tickers)
+    return list(dict.fromkeys(tickers))
+
+def data_version():
+    """Version för all data som noderna bygger på."""
+    return (price_store.get_version(), str(get_trading_calendar().last_session()), universe_version())
+
+def _node_lock(name):
+    with _lock:
+        return _node_locks.setdefault(name, threading.Lock())
+
+def _cached(name, version):
+    with _lock:
+        cached = _memo.get(name)
+    return cached if cached is not None and cached[0] == version else None
+
+def _compute(name, version):
+    if _cached(name, version) is not None:
+        metrics.count("cache_requests_total", cache="datagraph", node=name, result="hit")
+        return
+    with _node_lock(name):
+        # En annan tråd kan ha räknat noden medan vi väntade
+        if _cached(name, version) is not None:
+            metrics.count("cache_requests_total", cache="datagraph", node=name, result="hit")
+            return
+        metrics.count("cache_requests_total", cache="datagraph", node=name, result="miss")
+        func, depends, _ = _nodes[name]
+        with _lock:
+            arguments = [_memo[d][1] for d in depends]
+        with metrics.span(f"compute:{name}"):
+            value = func(*arguments)
+        with _lock:
+            _memo[name] = (version, value)
+
+def get(name):
+    """
+    Värdet för en nod, beräknat om det saknas eller är inaktuellt. Hämtning
+    och beräkning sker utan det gemensamma låset: anrop som läser färdiga noder
+    väntar aldrig på en pågående uppdatering av andra noder.
+    """
+    order = _subgraph(name)
+    tickers = _tickers(order)
+    if tickers:
+        price_store.update_prices(tickers)
+    version = data_version()
+    for current in order:
+        _compute(current, version)
+    with _lock:
+        return _memo[name][1]
+
+def invalidate(name=None):
+    """Glömmer en nod (eller alla), t.ex. efter manuell ändring av data på disk."""
+    with _lock:
+        if name is None:
+            _memo.clear()
+        else:
+            _memo.pop(name, None)
+
+#############################
+# Delade noder
+#############################
+
+@node("qqq_history", tickers=["QQQ"])
+def _qqq_history():
+    return price_store.get_history("QQQ", refresh=False)
+
+@node("qqq_phase", depends=["qqq_history"])
+def _qqq_phase(history):
+    # MA20/MA200/Deviation och marknadsfas över hela historiken, inkrementellt
+    data = update_indicator_table("QQQ", history)
+    return update_market_phase("QQQ", data)
+
+@node("vix_history", tickers=["^VIX"])
+def _vix_history():
+    return price_store.get_history("^VIX", refresh=False)
+
+@node("sp500_closes", tickers=get_sp500_tickers)
+def _sp500_closes():
+    # float32-panel: en åttondel av minnet mot alla fält i float64
+    return price_store.get_panel(get_sp500_tickers(), ["Close"], refresh=False).frame("Close")
+
+@node("sp500_breadth", depends=["sp500_closes"])
+def _sp500_breadth(closes):
+    return update_breadth("sp500", closes, universe_version())
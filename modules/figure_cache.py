@@ -0,0 +1,219 @@
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import plotly.io as pio
+from modules import datagraph, metrics, price_store
+from modules.trading_calendar import INTERVAL_DAYS
+
+try:
+    import brotli   # Valfritt; utan brotli används gzip
+except ImportError:
+    brotli = None
+
+# --------------------------------------------------
+# Cache för serialiserade figurer
+# --------------------------------------------------
+# Figurer som bara beror på prisdata (t.ex. stapeldiagrammen per intervall)
+# byggs och serialiseras en gång per (sida, intervall, dataversion). Nästa
+# anrop, från vilken användare som helst, blir ett uppslag. Före uppslaget
+# kontrolleras sidans tickers mot leverantören (som i datagraph.get); när
+# prisdatabasen får ny data, en ny handelsdag börjar eller sidans egen version
+# ändras (t.ex. en universumfil) byggs figuren om.
+#
+#   register_figure("top_50_stocks", create_top_stocks_figure, tickers=...)
+#   get_figure("top_50_stocks", "6M")   -> figur som dict (delas, får inte ändras)
+#
+# Sidor som registreras med prebuilt=True (t.ex. stora universum) byggs bara av
+# warm() i bakgrundsjobb; anrop får senast byggda figuren, eller None innan den
+# byggts första gången, och väntar aldrig på ett bygge.
+#
+# Dash-callbacks får figuren som dict och Dash serialiserar den själv; för dem
+# sparar cachen bygget. Den färdiga JSON-texten, ETag och de komprimerade svaren
+# används bara av /figures/<sida>/<intervall>. Alla svar från servern
+# komprimeras med brotli eller gzip (se enable_compression).
+
+_builders = {}    # sida -> (funktion(intervall) -> go.Figure, intervall, tickers, version, prebuilt)
+_entries = {}     # (sida, intervall) -> FigureEntry
+_build_locks = {} # (sida, intervall) -> lås, så att en figur bara byggs i en tråd åt gången
+_lock = threading.Lock()
+
+class FigureEntry:
+    def __init__(self, version, body):
+        self.version = version
+        self.body = body                      # JSON-text
+        self.figure = json.loads(body)        # Samma figur som dict, för Dash-callbacks
+        self.etag = hashlib.blake2b(body.encode(), digest_size=8).hexdigest()
+
+def register_figure(page, build, intervals=tuple(INTERVAL_DAYS), tickers=None, version=None, prebuilt=False):
+    """
+    Registrerar hur en sidas figur byggs för ett intervall. tickers (lista eller
+    funktion) uppdateras före varje uppslag; version() läggs till dataversionen.
+    Med prebuilt=True byggs figurerna bara av warm().
+    """
+    _builders[page] = (build, tuple(intervals), tickers, version, prebuilt)
+
+def _refresh(page):
+    tickers = _builders[page][2]
+    if tickers:
+        price_store.update_prices(tickers() if callable(tickers) else tickers)
+
+def _version(page):
+    version = _builders[page][3]
+    return datagraph.data_version(), version() if version is not None else None
+
+BUILD_ATTEMPTS = 2   # Ny data under bygget: byggs om en gång med den nya datan
+
+def _build_lock(key):
+    with _lock:
+        return _build_locks.setdefault(key, threading.Lock())
+
+def _current(key, version):
+    with _lock:
+        entry = _entries.get(key)
+    return entry if entry is not None and entry.version == version else None
+
+def get_entry(page, interval):
+    """
+    Cachad figur för (sida, intervall), ombyggd om dataversionen har ändrats.
+    För sidor med prebuilt=True: senast byggda figuren, eller None.
+    """
+    if interval not in _builders[page][1]:
+        raise KeyError(f"Okänt intervall för {page}: {interval}")
+    if _builders[page][4]:
+        with _lock:
+            entry = _entries.get((page, interval))
+        metrics.count("cache_requests_total", cache="figures", page=page, result="miss" if entry is None else "hit")
+        return entry
+    return _entry(page, interval)
+
+def _entry(page, interval):
+    build = _builders[page][0]
+    key = (page, interval)
+    _refresh(page)
+    entry = _current(key, _version(page))
+    if entry is not None:
+        metrics.count("cache_requests_total", cache="figures", page=page, result="hit")
+        return entry
+    with _build_lock(key):
+        # Samtidiga missar väntar på samma bygge i stället för att bygga själva
+        entry = _current(key, _version(page))
+        if entry is not None:
+            metrics.count("cache_requests_total", cache="figures", page=page, result="hit")
+            return entry
+        metrics.count("cache_requests_total", cache="figures", page=page, result="miss")
+        for _ in range(BUILD_ATTEMPTS):
+            # Versionen läses före bygget: sparas ny data under bygget får figuren
+            # den gamla versionen och byggs om i stället för att visas inaktuell
+            version = _version(page)
+            fig = build(interval)
+            if _version(page) == version:
+                break
+        with metrics.span("serialize"):
+            entry = FigureEntry(version, pio.to_json(fig, validate=False))
+        with _lock:
+            _entries[key] = entry
+    return entry
+
+def get_figure(page, interval):
+    entry = get_entry(page, interval)
+    return entry.figure if entry is not None else None
+
+def warm(page):
+    """Bygger en sidas figurer för alla intervall (bakgrundsjobb)."""
+    return {interval: _entry(page, interval) for interval in _builders[page][1]}
+
+def invalidate():
+    with _lock:
+        _entries.clear()
+
+#############################
+# HTTP: figurer som JSON, ETag och komprimering
+#############################
+
+MIN_COMPRESS_BYTES = 1024
+COMPRESS_MIMETYPES = {"application/json", "text/html", "text/css", "text/plain",
+                      "application/javascript", "text/javascript"}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5          # Snabbt nog att köras per svar
+COMPRESSED_CACHE_SIZE = 64  # Komprimerade svar med ETag som sparas
+
+_compressed = OrderedDict() # (etag, kodning) -> bytes
+
+def register_endpoint(server, path="/figures"):
+    """Lägger till <path>/<sida>/<intervall> som svarar med figurens JSON och ETag."""
+    from flask import Response, abort
+
+    def serve_figure(page, interval):
+        if page not in _builders or interval not in _builders[page][1]:
+            abort(404)
+        entry = get_entry(page, interval)
+        if entry is None:
+            abort(503)   # Byggs i bakgrunden
+        response = Response(entry.body, mimetype="application/json")
+        response.set_etag(entry.etag)
+        # Webbläsare och proxyer får spara svaret men måste fråga om det är aktuellt
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    server.add_url_rule(f"{path}/<page>/<interval>", "figures", serve_figure)
+
+def _encoding(request):
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+def _compressed_body(data, encoding, etag):
+    if etag is None:
+        return _compress(data, encoding)
+    key = (etag, encoding)
+    with _lock:
+        body = _compressed.get(key)
+        if body is not None:
+            _compressed.move_to_end(key)
+            return body
+    body = _compress(data, encoding)
+    with _lock:
+        _compressed[key] = body
+        while len(_compressed) > COMPRESSED_CACHE_SIZE:
+            _compressed.popitem(last=False)
+    return body
+
+def enable_compression(server):
+    """ETag/304 för GET-svar och brotli/gzip för alla textsvar från servern."""
+    from flask import request
+
+    @server.after_request
+    def compress_response(response):
+        if response.direct_passthrough or response.status_code != 200 \
+                or "Content-Encoding" in response.headers or response.mimetype not in COMPRESS_MIMETYPES:
+            return response
+        data = response.get_data()
+        encoding = _encoding(request) if len(data) >= MIN_COMPRESS_BYTES else None
+        if encoding is not None:
+            response.vary.add("Accept-Encoding")
+        etag = None
+        if request.method in ("GET", "HEAD"):
+            response.add_etag(overwrite=False)
+            etag, weak = response.get_etag()
+            if encoding is not None:
+                # Komprimerade svar är en egen representation med egen ETag
+                etag = f"{etag}-{encoding}"
+                response.set_etag(etag, weak)
+            response.make_conditional(request)
+            if response.status_code == 304:
+                return response
+        if encoding is not None:
+            response.set_data(_compressed_body(data, encoding, etag))
+            response.headers["Content-Encoding"] = encoding
+            metrics.inc("compressed_responses_total", encoding=encoding)
+        return response
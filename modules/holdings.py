@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from modules import metrics, price_store, providers
+
+# --------------------------------------------------
+# Fondinnehav (ETF:er) med lokal cache och TTL
+# --------------------------------------------------
+# Innehaven sparas som data/holdings/<TICKER>.parquet med de innehav och
+# vikter som leverantören ger (Yahoo: bara de tio största). Varje post har en
+# egen tidsstämpel (filens ändringstid) och räknas som aktuell i
+# HOLDINGS_TTL_DAYS, eller EMPTY_TTL_HOURS om leverantören inte hade några
+# innehav. Anrop besvaras från minnet; inaktuella poster returneras direkt och
+# uppdateras i bakgrunden. prefetch() hämtar alla saknade och inaktuella
+# poster på en gång (bakgrundsjobb). Med en separat ingest-process
+# (MARKETBREADTH_INGEST=external) läses innehaven bara från disk.
+
+HOLDINGS_DIR = os.path.join(price_store.DATA_DIR, "holdings")
+HOLDINGS_TTL_DAYS = 7      # Innehav ändras sällan
+EMPTY_TTL_HOURS = 12       # Försök igen tidigare om leverantören saknade innehav
+PREFETCH_WORKERS = 4
+
+_entries = {}              # ticker -> (DataFrame med HOLDINGS_COLUMNS, hämtad som time.time())
+_refreshing = set()        # Tickers som uppdateras i bakgrunden just nu
+_lock = threading.Lock()
+
+def _path(ticker):
+    return os.path.join(HOLDINGS_DIR, f"{ticker.replace('^', '_')}.parquet")
+
+def _empty_table():
+    return pd.DataFrame(columns=providers.HOLDINGS_COLUMNS)
+
+def _is_stale(entry):
+    table, fetched = entry
+    ttl = EMPTY_TTL_HOURS * 3600 if table.empty else HOLDINGS_TTL_DAYS * 86400
+    return time.time() - fetched >= ttl
+
+def _load(ticker):
+    # Minnet först, sedan disk
+    with _lock:
+        entry = _entries.get(ticker)
+    if price_store.EXTERNAL_INGEST and entry is not None and os.path.exists(_path(ticker)) \
+            and os.path.getmtime(_path(ticker)) > entry[1]:
+        entry = None   # Ingest-processen har sparat nyare innehav
+    if entry is None and os.path.exists(_path(ticker)):
+        entry = (pd.read_parquet(_path(ticker)), os.path.getmtime(_path(ticker)))
+        with _lock:
+            _entries[ticker] = entry
+    return entry
+
+def refresh(ticker):
+    """Hämtar innehaven från leverantören och sparar dem. Vid fel behålls befintlig post."""
+    if price_store.EXTERNAL_INGEST:
+        # Ingest-processen hämtar; här läses bara det som finns på disk
+        return _load(ticker)
+    metrics.count("upstream_requests_total", provider=providers.get_provider().name)
+    try:
+        table = providers.get_provider().holdings(ticker)
+    except Exception as e:
+        print(f"❌ Fel vid hämtning av innehav för {ticker}: {e}")
+        return _load(ticker)
+    table = _empty_table() if table is None else table.reindex(columns=providers.HOLDINGS_COLUMNS)
+    table = table.sort_values("Weight", ascending=False, na_position="last").reset_index(drop=True)
+    os.makedirs(HOLDINGS_DIR, exist_ok=True)
+    path = _path(ticker)
+    tmp_path = path + ".tmp"
+    table.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+    entry = (table, time.time())
+    with _lock:
+        _entries[ticker] = entry
+    return entry
+
+def _refresh_in_background(ticker):
+    with _lock:
+        if ticker in _refreshing:
+            return
+        _refreshing.add(ticker)
+
+    def run():
+        try:
+            refresh(ticker)
+        finally:
+            with _lock:
+                _refreshing.discard(ticker)
+
+    threading.Thread(target=run, name=f"holdings-{ticker}", daemon=True).start()
+
+def get_holdings(ticker):
+    """
+    Innehaven från leverantören (Symbol, Name, Weight i procent) sorterade efter vikt, eller
+    None om inga finns. Hämtas bara direkt om tickern aldrig har hämtats.
+    """
+    entry = _load(ticker)
+    if entry is None:
+        metrics.count("cache_requests_total", cache="holdings", result="miss")
+        entry = refresh(ticker)
+        if entry is None:
+            return None
+    else:
+        metrics.count("cache_requests_total", cache="holdings", result="hit")
+        if _is_stale(entry) and not price_store.EXTERNAL_INGEST:
+            _refresh_in_background(ticker)
+    table = entry[0]
+    return None if table.empty else table
+
+def prefetch(tickers):
+    """Hämtar saknade och inaktuella innehav parallellt. Returnerar antal hämtade."""
+    due = []
+    for ticker in tickers:
+        entry = _load(ticker)
+        if entry is None or _is_stale(entry):
+            due.append(ticker)
+    if due:
+        with ThreadPoolExecutor(max_workers=PREFETCH_WORKERS) as pool:
+            list(pool.map(refresh, due))
+    return len(due)
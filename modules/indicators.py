@@ -0,0 +1,155 @@
+import os
+import copy
+import numpy as np
+import pandas as pd
+from modules import price_store, table_store
+
+#############################
+# Indikatorer: MA20, MA200, Deviation och LongTermTrend
+#############################
+# add_indicators() räknar om allt med pandas (som tidigare i fetch_data).
+# IndicatorState håller ringbuffertar med löpande summor och uppdaterar samma
+# värden i konstant tid per ny stapel, för en eller många tickers samtidigt.
+
+SHORT_WINDOW = 20
+LONG_WINDOW = 200
+INDICATOR_DIR = os.path.join(price_store.DATA_DIR, "indicators")
+
+def add_indicators(data):
+    """Lägger till MA200, MA20, Deviation och LongTermTrend i en frame med Close."""
+    # Beräkna MA200 för långsiktig trendbedömning
+    data["MA200"] = data["Close"].rolling(window=LONG_WINDOW).mean()
+    # Beräkna MA20 för kortsiktiga signaler
+    data["MA20"] = data["Close"].rolling(window=SHORT_WINDOW).mean()
+    # Beräkna relativ avvikelse (absolut procentuell skillnad mellan Close och MA20)
+    data["Deviation"] = np.where(data["MA20"].notna(),
+                                 abs(data["Close"] - data["MA20"]) / data["MA20"],
+                                 np.nan)
+    # Långsiktig trend: bull om Close >= MA200, annars bear
+    data["LongTermTrend"] = np.where(data["Close"] >= data["MA200"], "bull", "bear")
+    return data
+
+class RollingMean:
+    """Glidande medelvärde över window staplar för N serier, O(1) per stapel."""
+
+    def __init__(self, window, n_series=1):
+        self.window = window
+        self.buffer = np.full((window, n_series), np.nan)
+        self.total = np.zeros(n_series)        # Summa av giltiga värden i fönstret
+        self.valid = np.zeros(n_series, dtype=np.int64)
+        self.position = 0                      # Nästa plats i ringbufferten
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        old = self.buffer[self.position]
+        old_ok = ~np.isnan(old)
+        new_ok = ~np.isnan(values)
+        self.total -= np.where(old_ok, old, 0.0)
+        self.total += np.where(new_ok, values, 0.0)
+        self.valid += new_ok.astype(np.int64) - old_ok.astype(np.int64)
+        self.buffer[self.position] = values
+        self.position = (self.position + 1) % self.window
+        if self.position == 0:
+            # Räkna om summan exakt en gång per varv så att avrundningsfel inte ackumuleras
+            self.total = np.nansum(self.buffer, axis=0)
+        # Som pandas rolling(window).mean(): NaN om fönstret inte är fullt med giltiga värden
+        return np.where(self.valid == self.window, self.total / self.window, np.nan)
+
+    def to_dict(self):
+        return {"window": self.window, "buffer": self.buffer.tolist(),
+                "position": self.position}
+
+    @classmethod
+    def from_dict(cls, state):
+        mean = cls(state["window"], len(state["buffer"][0]))
+        mean.buffer = np.array(state["buffer"], dtype=float)
+        mean.position = state["position"]
+        mean.total = np.nansum(mean.buffer, axis=0)
+        mean.valid = (~np.isnan(mean.buffer)).sum(axis=0)
+        return mean
+
+class IndicatorState:
+    """Strömmande MA20/MA200/Deviation/LongTermTrend för N tickers."""
+
+    def __init__(self, n_series=1):
+        self.short = RollingMean(SHORT_WINDOW, n_series)
+        self.long = RollingMean(LONG_WINDOW, n_series)
+
+    def update(self, close):
+        """Tar emot nästa stängningskurs (skalär eller en per ticker) och returnerar indikatorerna."""
+        close = np.atleast_1d(np.asarray(close, dtype=float))
+        ma20 = self.short.update(close)
+        ma200 = self.long.update(close)
+        deviation = np.where(np.isnan(ma20), np.nan, np.abs(close - ma20) / ma20)
+        trend = np.where(close >= ma200, "bull", "bear")
+        return {"MA200": ma200, "MA20": ma20, "Deviation": deviation, "LongTermTrend": trend}
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def to_dict(self):
+        return {"short": self.short.to_dict(), "long": self.long.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state):
+        indicator = cls.__new__(cls)
+        indicator.short = RollingMean.from_dict(state["short"])
+        indicator.long = RollingMean.from_dict(state["long"])
+        return indicator
+
+    @classmethod
+    def from_history(cls, closes):
+        """Bygger tillståndet från historik (1-D för en ticker eller 2-D datum × tickers)."""
+        closes = np.asarray(closes, dtype=float)
+        if closes.ndim == 1:
+            closes = closes[:, None]
+        indicator = cls(closes.shape[1])
+        # Bara de sista LONG_WINDOW raderna påverkar tillståndet
+        for row in closes[-LONG_WINDOW:]:
+            indicator.update(row)
+        return indicator
+
+#############################
+# Persistenta indikatortabeller
+#############################
+
+def _path(name):
+    return os.path.join(INDICATOR_DIR, f"{name}.parquet")
+
+def _load_table(name):
+    return table_store.load(_path(name))
+
+def _save_table(name, table, saved):
+    table_store.save(_path(name), table, saved)
+
+def update_indicator_table(name, prices):
+    """
+    Returnerar prices (Date-index, kolumn Close) med indikatorkolumner.
+    Sparat tillstånd återanvänds så att bara nya staplar (och den senast sparade,
+    som kan ha ändrats) räknas; annars byggs allt om med add_indicators().
+    Tillståndet sparas före sista raden, så att den alltid kan räknas om.
+    """
+    columns = ["Close", "MA200", "MA20", "Deviation", "LongTermTrend"]
+    table, saved = _load_table(name)
+    if table is not None and len(table) >= 2 and len(prices) \
+            and prices.index[0] == table.index[0] and table.index[-2] in prices.index \
+            and prices.at[table.index[-2], "Close"] == table["Close"].iloc[-2]:
+        new = prices.loc[prices.index > table.index[-2], ["Close"]].copy()
+        # Tomt om priserna slutar före den senast sparade stapeln; tabellen gäller ändå
+        unchanged = new.empty or (len(new) == 1 and new.index[0] == table.index[-1]
+                                  and new["Close"].iloc[0] == table["Close"].iloc[-1])
+        if not unchanged:
+            state = IndicatorState.from_dict(saved["state"])
+            rows = []
+            for close in new["Close"].to_numpy(dtype=float):
+                checkpoint = state.copy()
+                values = state.update(close)
+                rows.append([values[col][0] for col in columns[1:]])
+            new[columns[1:]] = pd.DataFrame(rows, index=new.index, columns=columns[1:])
+            table = pd.concat([table.iloc[:-1], new])
+            _save_table(name, table, {"state": checkpoint.to_dict()})
+        return prices.join(table[columns[1:]])
+    table = add_indicators(prices.copy())
+    checkpoint = IndicatorState.from_history(prices["Close"].to_numpy(dtype=float)[:-1])
+    _save_table(name, table[columns], {"state": checkpoint.to_dict()})
+    return table
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+from modules import breadth, constituents, datagraph, holdings, price_matrix, price_store, scheduler
+from modules.constituents import get_sp500_tickers
+from modules.risk_score import SECTOR_ETFS
+from modules.sector_leaders import SECTOR_TICKERS
+
+# --------------------------------------------------
+# Ingest-process: all hämtning från leverantören på ett ställe
+# --------------------------------------------------
+# Med flera webbprocesser (t.ex. gunicorn-workers) skulle varje process annars
+# hämta och hålla egna kopior av samma data. I stället körs
+#
+#   python -m modules.ingest            # uppdaterar enligt schemaläggarens regler
+#   python -m modules.ingest --once     # en uppdatering, t.ex. från cron
+#
+# och webbprocesserna startas med MARKETBREADTH_INGEST=external. Processen
+# uppdaterar S&P 500-listan, kurserna (Parquet), ETF-innehaven och de sparade
+# tabellerna (indikatorer, fas och bredd, se table_store) och publicerar sedan
+# Close/Adj Close/Volume som minnesmappade matriser (se price_matrix).
+# Webbprocesserna mappar senaste versionen skrivskyddat och kontaktar aldrig
+# leverantören. Större universum i MARKETBREADTH_UNIVERSES (t.ex.
+# "russell3000,nasdaq100", se modules/universes) uppdateras block för block och
+# får sin bredd beräknad; de läses av webbprocesserna från Parquet-filerna.
+
+EXTRA_UNIVERSES = [u for u in os.environ.get("MARKETBREADTH_UNIVERSES", "").split(",") if u.strip()]
+
+def universe():
+    """Alla tickers som sidorna läser; S&P 500 först så att de ligger i ett sammanhängande block."""
+    return list(dict.fromkeys(get_sp500_tickers() + SECTOR_TICKERS + ["QQQ", "^VIX"] + SECTOR_ETFS))
+
+def run_once():
+    """Uppdaterar all data och publicerar en ny version av matriserna."""
+    constituents.refresh_if_stale()
+    tickers = universe()
+    price_store.update_prices(tickers)
+    holdings.prefetch(SECTOR_TICKERS)
+    # Härledda tabeller (QQQ:s indikatorer och fas, S&P 500-bredd) sparas bara
+    # här; webbprocesserna läser dem och skriver aldrig själva
+    datagraph.get("qqq_phase")
+    datagraph.get("sp500_breadth")
+    for name in EXTRA_UNIVERSES:
+        # Kurser och bredd i block, utan att hålla hela universumet i minnet
+        breadth.update_universe_breadth(name.strip())
+    frames = {ticker: price_store.load_fields(ticker, price_matrix.FIELDS) for ticker in tickers}
+    version = price_matrix.publish(price_store.MATRIX_DIR, frames, tickers)
+    failed = len(price_store.get_failures())
+    print(f"📦 Publicerade {version}: {len(tickers)} tickers" + (f", {failed} saknas" if failed else ""))
+    return version
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hämtar data och publicerar prismatriser")
+    parser.add_argument("--once", action="store_true", help="En uppdatering och sedan avsluta")
+    args = parser.parse_args(argv)
+    if price_store.EXTERNAL_INGEST:
+        parser.error("ingest-processen ska inte köras med MARKETBREADTH_INGEST=external")
+
+    last = None
+    while True:
+        ok = True
+        if scheduler.is_due(last):
+            try:
+                run_once()
+                last = pd.Timestamp.now(tz="UTC")
+            except Exception as e:
+                ok = False
+                print(f"❌ Uppdateringen misslyckades: {e}")
+        if args.once:
+            return 0 if ok else 1
+        time.sleep(scheduler.CHECK_SECONDS)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+import os
+import json
+import time
+import threading
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from dash import Patch, no_update
+from modules import metrics, price_store, providers
+from modules.returns import _valid_positions
+from modules.scheduler import CLOSE_DELAY_MINUTES
+from modules.trading_calendar import INTERVAL_DAYS, get_nyse_calendar, get_trading_calendar
+
+# --------------------------------------------------
+# Liveläge: minutstaplar under handelsdagen
+# --------------------------------------------------
+# Med MARKETBREADTH_LIVE=1 hämtar en bakgrundstråd var LIVE_SECONDS sekund de
+# minutstaplar som tillkommit sedan förra hämtningen, för alla tickers som de
+# registrerade mottagarna följer (S&P 500, sektor-ETF:erna, riskkomponenterna).
+# Mottagarna bygger sitt utgångsläge en gång per handelsdag från de dagliga
+# kurserna före i dag och uppdateras sedan bara för tickers vars pris har
+# ändrats, så att arbetet per hämtning är proportionellt mot antalet ändrade
+# tickers. Varje hämtning med ändringar ökar tick; sidorna frågar med en
+# dcc.Interval och skickar bara ändrade värden som Dash Patch.
+#
+#   live.register("sp500", LiveUniverse(universes.get_universe...))
+#   tick, top = live.read("sp500", lambda universe: universe.top("1D", 50))
+#
+# Med en separat ingest-process (MARKETBREADTH_INGEST=external) är liveläget
+# avstängt: webbprocesserna kontaktar aldrig leverantören.
+
+LIVE = os.environ.get("MARKETBREADTH_LIVE", "0") == "1" and not price_store.EXTERNAL_INGEST
+LIVE_SECONDS = int(os.environ.get("MARKETBREADTH_LIVE_SECONDS", "60"))
+LOOKBACK_MINUTES = 5    # Staplar som hämtas om; Yahoo publicerar ibland en minut sent
+TIMEZONE = "America/New_York"
+
+_consumers = {}         # namn -> mottagare med tickers(), rebuild(dag) och update(ändrade priser)
+_prices = {}            # ticker -> senaste pris i dag
+_seen = {}              # ticker -> tid för senaste stapel
+_tick = 0               # Ökar vid varje hämtning som ändrade minst ett pris
+_session_day = None     # Dagen som mottagarna är uppbyggda för
+_tickers = []
+_lock = threading.RLock()
+_thread = None
+
+def register(name, consumer):
+    """Registrerar en mottagare av livepriser."""
+    with _lock:
+        _consumers[name] = consumer
+        if _session_day is not None:
+            _rebuild(name, consumer, _session_day)
+
+def _now():
+    return pd.Timestamp.now(tz=TIMEZONE).tz_localize(None)
+
+@lru_cache(maxsize=8)
+def session_hours(day):
+    """(öppning, stängning) i New York-tid för en dag, eller None om börsen är stängd."""
+    schedule = get_nyse_calendar().schedule(start_date=day, end_date=day)
+    if schedule.empty:
+        return None
+    row = schedule.iloc[0]
+    return (row["market_open"].tz_convert(TIMEZONE).tz_localize(None),
+            row["market_close"].tz_convert(TIMEZONE).tz_localize(None))
+
+def is_live(now=None):
+    """
+    Om liveläget gäller just nu: från öppning tills de dagliga staplarna för
+    dagen har hunnit hämtas efter stängning (se scheduler.CLOSE_DELAY_MINUTES).
+    """
+    if not LIVE:
+        return False
+    now = _now() if now is None else now
+    hours = session_hours(now.normalize())
+    return hours is not None and hours[0] <= now < hours[1] + pd.Timedelta(minutes=CLOSE_DELAY_MINUTES)
+
+def tick():
+    return _tick
+
+def read(name, func):
+    """(tick, func(mottagare)) under samma lås som uppdateringarna, eller (tick, None) före första bygget."""
+    with _lock:
+        if _session_day is None:
+            return _tick, None
+        return _tick, func(_consumers[name])
+
+def _rebuild(name, consumer, day):
+    try:
+        consumer.rebuild(day)
+        if _prices:
+            consumer.update(_prices)
+    except Exception as e:
+        print(f"❌ Liveläget kunde inte bygga {name}: {e}")
+
+def _start_session(day):
+    global _session_day, _tickers
+    _prices.clear()
+    _seen.clear()
+    tickers = []
+    for name, consumer in _consumers.items():
+        _rebuild(name, consumer, day)
+        tickers.extend(consumer.tickers())
+    _tickers = list(dict.fromkeys(tickers))
+    _session_day = day
+
+def poll(now=None):
+    """Hämtar nya minutstaplar och uppdaterar mottagarna. Returnerar antal ändrade tickers."""
+    global _tick
+    now = _now() if now is None else now
+    if not is_live(now):
+        return 0
+    day = now.normalize()
+    with _lock:
+        if _session_day != day:
+            with metrics.span("rebuild", callback="live"):
+                _start_session(day)
+        tickers = list(_tickers)
+        latest = max(_seen.values(), default=None)
+    opening = session_hours(day)[0]
+    start = opening if latest is None else max(opening, latest - pd.Timedelta(minutes=LOOKBACK_MINUTES))
+    provider = providers.get_provider()
+    metrics.count("upstream_requests_total", provider=provider.name)
+    with metrics.span("download", callback="live"):
+        frames = provider.intraday(tickers, start)
+
+    # Bara tickers med en ny stapel och ett nytt pris går vidare
+    changed = {}
+    for ticker, bars in frames.items():
+        closes = bars["Close"].dropna()
+        if closes.empty or closes.index[-1] <= _seen.get(ticker, pd.Timestamp.min):
+            continue
+        _seen[ticker] = closes.index[-1]
+        price = float(closes.iloc[-1])
+        if _prices.get(ticker) != price:
+            changed[ticker] = price
+    metrics.observe("live_changed_tickers", len(changed), buckets=(0, 10, 50, 100, 250, 500, 1000, 5000))
+    if not changed:
+        return 0
+    with _lock, metrics.span("update", callback="live"):
+        _prices.update(changed)
+        for name, consumer in _consumers.items():
+            try:
+                consumer.update(changed)
+            except Exception as e:
+                print(f"❌ Liveläget kunde inte uppdatera {name}: {e}")
+        _tick += 1
+    return len(changed)
+
+def _loop():
+    while True:
+        started = time.perf_counter()
+        try:
+            poll()
+        except Exception as e:
+            print(f"❌ Fel i liveläget: {e}")
+        time.sleep(max(LIVE_SECONDS - (time.perf_counter() - started), 1))
+
+def start():
+    """Startar hämtningen av minutstaplar (en gång per process, bara med MARKETBREADTH_LIVE=1)."""
+    global _thread
+    if _thread is not None or not LIVE:
+        return
+    _thread = threading.Thread(target=_loop, name="marketbreadth-live", daemon=True)
+    _thread.start()
+
+#############################
+# Avkastning och topplistor för ett universum
+#############################
+
+class LiveUniverse:
+    """
+    Avkastning per ticker för de intervall som slutar i dag, med livepriset som
+    slutpris. Startpriserna räknas som i returns.compute_interval_returns från
+    de dagliga kurserna före i dag (1D: föregående stängning). Intervall som
+    slutade tidigare (t.ex. 1V före fredag) ändras inte under dagen.
+    """
+
+    BUFFER = 2   # Topplistan hålls med BUFFER × n kandidater
+
+    def __init__(self, tickers, field="Close", require_full_period=False):
+        self._source = tickers   # Lista eller funktion som returnerar en lista
+        self.field = field
+        self.require_full_period = require_full_period
+        self.intervals = []
+        self.names = []
+        self.columns = {}
+        self._base = np.empty((0, 0))
+        self._scale = np.empty(0)
+        self._returns = np.empty((0, 0))   # Avkastning i procent, -inf där den saknas (sorteras sist)
+        self._top = {}     # (intervall, n) -> (kandidater, tröskel, Series)
+        self._dirty = {}   # (intervall, n) -> kolumner som ändrats sedan topplistan räknades
+
+    def tickers(self):
+        return list(self._source() if callable(self._source) else self._source)
+
+    def rebuild(self, day):
+        calendar = get_trading_calendar()
+        bounds = {interval: calendar.interval_dates(interval) for interval in INTERVAL_DAYS}
+        intervals = [i for i, b in bounds.items() if b is not None and pd.Timestamp(b[1]) > day]
+        sessions = calendar.days.tz_localize(None)
+        previous = sessions[sessions < day]
+        starts = [pd.Timestamp(bounds[i][0]) for i in intervals]
+        start = min(starts + list(previous[-1:]))
+        fields = [self.field] if self.field == "Close" else [self.field, "Close"]
+        panel = price_store.get_panel(self.tickers(), fields, start=start, end=day)
+        values = panel.values(self.field)
+        n_rows, n_columns = values.shape
+        columns = np.arange(n_columns)
+        next_valid, prev_valid = _valid_positions(values)
+        dates = panel.dates.to_numpy(dtype="datetime64[ns]")
+
+        last = prev_valid[-1] if n_rows else np.full(n_columns, -1)
+        previous_close = np.where(last >= 0, values[np.maximum(last, 0), columns], np.nan)
+        # Minutpriserna är ojusterade; justerade fält skalas med senaste dagens kvot
+        scale = np.ones(n_columns)
+        if self.field != "Close":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                ratio = previous_close / np.where(last >= 0, panel.values("Close")[np.maximum(last, 0), columns], np.nan)
+            scale = np.where(np.isfinite(ratio) & (ratio > 0), ratio, 1.0)
+        base = np.full((len(intervals), n_columns), np.nan)
+        for k, (interval, interval_start) in enumerate(zip(intervals, starts)):
+            row = dates.searchsorted(np.datetime64(interval_start))
+            if interval == "1D" or row >= n_rows:
+                # 1D, eller intervallet börjar i dag: föregående stängning är startpris
+                base[k] = previous_close
+                continue
+            first = next_valid[row]
+            ok = first < n_rows
+            first = np.where(ok, first, 0)
+            if self.require_full_period:
+                ok &= dates[first] <= np.datetime64(interval_start)
+            base[k] = np.where(ok, values[first, columns], np.nan)
+        base[base == 0] = np.nan
+
+        self.intervals = intervals
+        self.names = list(panel.tickers)
+        self.columns = dict(panel.columns)
+        self._base = base
+        self._scale = scale
+        self._returns = self._compute(previous_close, base)
+        self._top.clear()
+        self._dirty.clear()
+
+    @staticmethod
+    def _compute(prices, base):
+        with np.errstate(invalid="ignore"):
+            return np.nan_to_num((prices - base) / base * 100, nan=-np.inf)
+
+    def update(self, prices):
+        """Nya priser (ticker -> pris); bara de ändrade kolumnerna räknas om."""
+        changed = [(self.columns[t], p) for t, p in prices.items() if t in self.columns]
+        if not changed:
+            return
+        positions = np.fromiter((c for c, _ in changed), dtype=np.intp, count=len(changed))
+        values = np.fromiter((p for _, p in changed), dtype=float, count=len(changed))
+        self._returns[:, positions] = self._compute(values * self._scale[positions], self._base[:, positions])
+        for dirty in self._dirty.values():
+            dirty.update(positions.tolist())
+
+    def top(self, interval, n=None):
+        """
+        De n tickers med högst avkastning (alla om n är None) som Series, sorterad.
+        Mellan två anrop sorteras bara de tidigare kandidaterna och de ändrade
+        tickers; hela universumet sorteras om bara om kandidaterna inte räcker.
+        """
+        if interval not in self.intervals:
+            return None
+        values = self._returns[self.intervals.index(interval)]
+        n = len(values) if n is None else min(n, len(values))
+        key = (interval, n)
+        cached = self._top.get(key)
+        dirty = self._dirty.get(key)
+        if cached is not None and not dirty:
+            return cached[2]
+        size = min(self.BUFFER * n, len(values))
+        found = None
+        if cached is not None:
+            # Alla utanför kandidaterna har avkastning <= tröskeln sedan förra gången
+            candidates = np.union1d(cached[0], np.fromiter(dirty, dtype=np.intp))
+            order = np.argsort(-values[candidates], kind="stable")
+            if len(order) >= n and (n == 0 or values[candidates[order[n - 1]]] >= cached[1]):
+                rest = values[candidates[order[size:]]]
+                found = candidates[order[:size]], max(cached[1], rest.max() if len(rest) else -np.inf)
+        if found is None:
+            metrics.inc("live_full_ranks_total", interval=interval)
+            if size < len(values):
+                order = np.argpartition(-values, size - 1)
+                found = order[:size], values[order[size:]].max()
+            else:
+                found = np.arange(len(values)), -np.inf
+        candidates = found[0][np.argsort(-values[found[0]], kind="stable")]
+        chosen = candidates[:n]
+        chosen = chosen[values[chosen] > -np.inf]
+        series = pd.Series(values[chosen], index=[self.names[c] for c in chosen], name=interval)
+        self._top[key] = (candidates, found[1], series)
+        self._dirty[key] = set()
+        return series
+
+#############################
+# Stapeldiagram: första bygget och Patch per tick
+#############################
+
+DECIMALS = 2   # Värden avrundas som i diagrammen; mindre ändringar skickas inte
+
+def bar_state(interval, tick, top):
+    """Det som klienten visar (sparas i en dcc.Store)."""
+    return {"interval": interval, "tick": tick, "tickers": list(top.index),
+            "values": np.round(top.to_numpy(dtype=float), DECIMALS).tolist()}
+
+def bar_figure(fig, state):
+    """
+    Figuren som dict med vanliga listor i första spåret (plotly kodar annars
+    talserier binärt, och sådana kan inte ändras per index med Patch).
+    """
+    figure = json.loads(pio.to_json(fig, validate=False))
+    trace = figure["data"][0]
+    trace["x"] = list(state["tickers"])
+    for path in (("y",), ("text",), ("marker", "color")):
+        _set(trace, path, list(state["values"]))
+    return figure
+
+def _set(target, path, value):
+    for key in path[:-1]:
+        target = target[key]
+    target[path[-1]] = value
+
+def bar_patch(state, tick, top):
+    """Patch från det klienten visar (state) till top, och nytt state. no_update om inget ändrats."""
+    new_state = bar_state(state["interval"], tick, top)
+    patch = Patch()
+    trace = patch["data"][0]
+    if new_state["tickers"] == state["tickers"]:
+        changed = [i for i, (old, value) in enumerate(zip(state["values"], new_state["values"])) if old != value]
+        if not changed:
+            return no_update, new_state
+        for i in changed:
+            value = new_state["values"][i]
+            trace["y"][i] = value
+            trace["text"][i] = value
+            trace["marker"]["color"][i] = value
+    else:
+        # Ny ordning: bara spårets data ersätts, inte layouten
+        trace["x"] = new_state["tickers"]
+        trace["y"] = new_state["values"]
+        trace["text"] = new_state["values"]
+        trace["marker"]["color"] = new_state["values"]
+    metrics.count("live_patches_total", changed="values" if new_state["tickers"] == state["tickers"] else "order")
+    return patch, new_state
+
+def _bar_top(name, interval, n):
+    if not is_live():
+        return None, None
+    tick, top = read(name, lambda consumer: consumer.top(interval, n))
+    return (tick, top) if top is not None and not top.empty else (tick, None)
+
+def bar_view(name, interval, n, build):
+    """
+    (figur, state) för ett stapeldiagram från liveläget, eller None om
+    liveläget inte gäller intervallet. build(state) bygger figuren.
+    """
+    tick, top = _bar_top(name, interval, n)
+    if top is None:
+        return None
+    state = bar_state(interval, tick, top)
+    return bar_figure(build(state), state), state
+
+def bar_refresh(name, state, n, build, daily):
+    """
+    Svar på en dcc.Interval: (figur eller Patch, nytt state). Utan nya priser
+    sedan klientens tick skickas ingenting. daily(intervall) ger den dagliga
+    figuren när liveläget slutar.
+    """
+    if not state:
+        return no_update, no_update
+    interval = state["interval"]
+    if state.get("tick") is not None and state["tick"] == _tick and is_live():
+        return no_update, no_update
+    tick, top = _bar_top(name, interval, n)
+    if top is None:
+        if state.get("tick") is None:
+            return no_update, no_update
+        # Liveläget har slutat för dagen: tillbaka till den dagliga figuren
+        return daily(interval), {"interval": interval, "tick": None}
+    if state.get("tick") is None:
+        # Liveläget har börjat sedan sidan öppnades: hela figuren en gång
+        new_state = bar_state(interval, tick, top)
+        return bar_figure(build(new_state), new_state), new_state
+    return bar_patch(state, tick, top)
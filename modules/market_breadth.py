@@ -0,0 +1,173 @@
+from functools import lru_cache
+import dash
+from dash import dcc, html
+from dash.dependencies import Input, Output
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from modules import breadth, datagraph, metrics, scheduler, universes
+from modules.breadth import MA_WINDOWS
+
+#######################################
+# Visualisering: Marknadsbredd för S&P 500 (eller ett annat universum)
+#######################################
+MA_COLORS = {20: "orange", 50: "blue", 200: "purple"}
+DEFAULT_UNIVERSE = "sp500"
+
+def create_breadth_chart(table, label="S&P 500"):
+    fig = make_subplots(
+        rows=5, cols=1, shared_xaxes=True, vertical_spacing=0.04,
+        subplot_titles=("Advance/Decline-linje", "Andel över glidande medelvärde (%)",
+                        "Nya 52-veckors toppar/bottnar",
+                        "McClellan Oscillator", "McClellan Summation Index")
+    )
+    fig.add_trace(go.Scatter(
+        x=table.index, y=table["AD Line"], mode="lines",
+        line=dict(color="black", width=1), name="A/D-linje"
+    ), row=1, col=1)
+    for window in MA_WINDOWS:
+        fig.add_trace(go.Scatter(
+            x=table.index, y=table[f"Above MA{window} (%)"], mode="lines",
+            line=dict(color=MA_COLORS.get(window), width=1), name=f"Över MA{window}"
+        ), row=2, col=1)
+    fig.add_trace(go.Scatter(
+        x=table.index, y=table["New Highs"], mode="lines",
+        line=dict(color="green", width=1), name="Nya toppar"
+    ), row=3, col=1)
+    fig.add_trace(go.Scatter(
+        x=table.index, y=-table["New Lows"], mode="lines",
+        line=dict(color="red", width=1), name="Nya bottnar (negativt)"
+    ), row=3, col=1)
+    oscillator = table["McClellan Oscillator"]
+    fig.add_trace(go.Bar(
+        x=table.index, y=oscillator, name="McClellan Oscillator",
+        marker_color=np.where(oscillator >= 0, "green", "red")
+    ), row=4, col=1)
+    fig.add_trace(go.Scatter(
+        x=table.index, y=table["McClellan Summation"], mode="lines",
+        line=dict(color="teal", width=1), name="Summation Index"
+    ), row=5, col=1)
+
+    latest = table.iloc[-1]
+    annotation_text = (
+        f"Stigande/fallande: {latest['Advances']:.0f}/{latest['Declines']:.0f}<br>"
+        f"Över MA50: {latest['Above MA50 (%)']:.1f}% | Över MA200: {latest['Above MA200 (%)']:.1f}%<br>"
+        f"Nya toppar/bottnar: {latest['New Highs']:.0f}/{latest['New Lows']:.0f}<br>"
+        f"McClellan: {latest['McClellan Oscillator']:.1f}"
+    )
+    fig.update_layout(
+        title=f"Marknadsbredd - {label}",
+        height=1200,
+        dragmode="pan",
+        hovermode="x",
+        template="plotly_white",
+        showlegend=True,
+        xaxis=dict(
+            rangeselector=dict(
+                buttons=[
+                    dict(count=3, label="3m", step="month", stepmode="backward"),
+                    dict(count=6, label="6m", step="month", stepmode="backward"),
+                    dict(count=1, label="1y", step="year", stepmode="backward"),
+                    dict(count=5, label="5y", step="year", stepmode="backward"),
+                    dict(step="all")
+                ]
+            )
+        ),
+        annotations=list(fig.layout.annotations) + [{
+            "xref": "paper",
+            "yref": "paper",
+            "x": 1,
+            "y": 1.06,
+            "xanchor": "right",
+            "yanchor": "bottom",
+            "text": annotation_text,
+            "showarrow": False,
+            "font": {"size": 12, "color": "black"},
+            "bgcolor": "white",
+            "bordercolor": "black",
+            "borderwidth": 1
+        }]
+    )
+    return fig
+
+def build_breadth_chart():
+    return create_breadth_chart(datagraph.get("sp500_breadth"))
+
+# Bakgrundsjobb: färdig breddfigur
+scheduler.register_job("market_breadth", build_breadth_chart)
+
+@lru_cache(maxsize=1)
+def _build_chart(day):
+    return build_breadth_chart()
+
+def _sp500_chart():
+    breadth_chart = scheduler.get_result("market_breadth")
+    if breadth_chart is None:
+        breadth_chart = _build_chart(pd.Timestamp.today().date())
+    return breadth_chart
+
+def build_universe_charts():
+    """
+    Breddfigurer för alla universum utom S&P 500 (bakgrundsjobb). De räknas i
+    block (se breadth) och kan ta minuter för t.ex. russell3000.
+    """
+    charts = {}
+    for universe in universes.list_universes():
+        if universe == DEFAULT_UNIVERSE:
+            continue
+        try:
+            table = breadth.get_universe_breadth(universe)
+            charts[universe] = create_breadth_chart(table, universe) if not table.empty \
+                else go.Figure(layout={"title": f"Ingen data för {universe}"})
+        except Exception as e:
+            print(f"❌ Marknadsbredd för {universe} kunde inte byggas: {e}")
+    return charts
+
+scheduler.register_job("market_breadth_universes", build_universe_charts)
+
+def _universe_chart(universe):
+    if universe == DEFAULT_UNIVERSE:
+        return _sp500_chart()
+    chart = (scheduler.get_result("market_breadth_universes") or {}).get(universe)
+    if chart is None:
+        return go.Figure(layout={"title": f"Marknadsbredd för {universe} beräknas i bakgrunden, försök igen om en stund"})
+    return chart
+
+def get_layout():
+    try:
+        breadth_chart = _sp500_chart()
+        return html.Div([
+            html.H1("Marknadsbredd", style={"textAlign": "center", "marginTop": "20px"}),
+            html.Div([
+                dcc.Dropdown(id="market-breadth-universe", options=universes.list_universes(),
+                             value=DEFAULT_UNIVERSE, clearable=False)
+            ], style={"width": "250px", "margin": "0 auto"}),
+            dcc.Loading(children=[dcc.Graph(id="market-breadth-chart", figure=breadth_chart)])
+        ])
+    except Exception as e:
+        print(f"❌ Kunde inte bygga Marknadsbredd: {e}")
+        return html.Div([
+            html.H1("Marknadsbredd", style={"textAlign": "center", "marginTop": "20px"}),
+            html.H3("Ingen data tillgänglig just nu", style={"textAlign": "center", "color": "red"})
+        ])
+
+def register_callbacks(app):
+    @app.callback(
+        Output("market-breadth-chart", "figure"),
+        [Input("market-breadth-universe", "value")],
+        prevent_initial_call=True
+    )
+    @metrics.instrument("update_breadth_universe")
+    def update_breadth_universe(universe):
+        try:
+            return _universe_chart(universe)
+        except Exception as e:
+            print(f"❌ Kunde inte bygga Marknadsbredd för {universe}: {e}")
+            return dash.no_update
+
+if __name__ == "__main__":
+    app = dash.Dash(__name__)
+    app.layout = get_layout()
+    register_callbacks(app)
+    app.run_server(debug=True)
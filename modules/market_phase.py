@@ -0,0 +1,378 @@
+import os
+import copy
+import numpy as np
+import pandas as pd
+from modules import price_store, table_store
+
+#############################
+# Marknadsfas-motor (NumPy)
+#############################
+# Samma regler som den tidigare radvisa loopen i process_market_phase, men
+# beräknad med arrayoperationer. Python-loopen går bara över fasbyten,
+# inte över varje rad.
+
+MIN_CONFIRMED_DAYS = 6    # Signal måste vara konsekvent i minst 6 dagar
+THRESHOLD = 0.02          # Minsta avvikelse från MA20 (2%)
+
+# Faskoder
+UNDEFINED = 0
+UPTREND = 1
+DOWNTREND = 2
+CHOPPY = 3
+PHASE_NAMES = np.array(["undefined", "uptrend", "downtrend", "choppy"], dtype=object)
+PHASE_DIR = os.path.join(price_store.DATA_DIR, "phases")
+
+def classify_signal(close, ma20, deviation):
+    """Daglig signal som faskod. Fungerar för 1-D (dagar) och 2-D (dagar × tickers)."""
+    close = np.asarray(close, dtype=float)
+    ma20 = np.asarray(ma20, dtype=float)
+    deviation = np.asarray(deviation, dtype=float)
+    signal = np.full(close.shape, CHOPPY, dtype=np.int8)
+    strong = deviation >= THRESHOLD
+    signal[(close > ma20) & strong] = UPTREND
+    signal[(close < ma20) & strong] = DOWNTREND
+    signal[np.isnan(ma20) | np.isnan(deviation)] = UNDEFINED
+    return signal
+
+def _next_position(positions, minimum):
+    # Första position >= minimum, eller None
+    k = np.searchsorted(positions, minimum, side="left")
+    return positions[k] if k < len(positions) else None
+
+def compute_market_phase(close, ma20, deviation):
+    """
+    Beräknar fas, CycleDay och cykelvändpunkter för en tidsserie.
+    Returnerar en dict med arrayer: phase (faskoder), cycle_day, cycle_top,
+    cycle_bottom samt segments (lista av (start, fas, choppy_från, slut)).
+    """
+    close = np.asarray(close, dtype=float)
+    n = len(close)
+    signal = classify_signal(close, ma20, deviation)
+
+    phase = np.full(n, UNDEFINED, dtype=np.int8)
+    cycle_day = np.zeros(n, dtype=np.int64)
+    cycle_top = np.full(n, np.nan)
+    cycle_bottom = np.full(n, np.nan)
+    segments = []
+
+    defined = np.flatnonzero(signal != UNDEFINED)
+    if len(defined) == 0:
+        return {"phase": phase, "cycle_day": cycle_day, "cycle_top": cycle_top,
+                "cycle_bottom": cycle_bottom, "segments": segments}
+
+    # Positioner (bland definierade dagar) där signalen skiljer sig från respektive fas
+    defined_signal = signal[defined]
+    differs = {code: defined[defined_signal != code] for code in (UPTREND, DOWNTREND, CHOPPY)}
+
+    start = defined[0]
+    current = signal[start]
+    while True:
+        mismatch = _next_position(differs[current], start + 1)
+        if mismatch is None:
+            segments.append((start, current, None, n))
+            break
+        if mismatch - start >= MIN_CONFIRMED_DAYS:
+            # Bekräftat fasbyte: markera topp/botten i den avslutade fasen
+            window = close[start:mismatch]
+            if current == UPTREND:
+                idx = start + np.nanargmax(window)
+                cycle_top[idx] = close[idx]
+            elif current == DOWNTREND:
+                idx = start + np.nanargmax(-window)
+                cycle_bottom[idx] = close[idx]
+            segments.append((start, current, None, mismatch))
+            start = mismatch
+            current = signal[mismatch]
+            continue
+        # För kort fas: "choppy" tills en avvikande signal kommer efter minst
+        # MIN_CONFIRMED_DAYS dagar från fasens start
+        change = _next_position(differs[CHOPPY], start + MIN_CONFIRMED_DAYS)
+        end = n if change is None else change
+        segments.append((start, current, mismatch, end))
+        if change is None:
+            break
+        start = change
+        current = signal[change]
+
+    positions = np.arange(n)
+    for start, current, choppy_from, end in segments:
+        split = end if choppy_from is None else choppy_from
+        phase[start:split] = current
+        phase[split:end] = CHOPPY
+        cycle_day[start:end] = positions[start:end] - start + 1
+
+    undefined = signal == UNDEFINED
+    phase[undefined] = UNDEFINED
+    cycle_day[undefined] = 0
+    return {"phase": phase, "cycle_day": cycle_day, "cycle_top": cycle_top,
+            "cycle_bottom": cycle_bottom, "segments": segments}
+
+def _phase_inputs(data):
+    return (data["Close"].to_numpy(dtype=float),
+            data["MA20"].to_numpy(dtype=float),
+            data["Deviation"].to_numpy(dtype=float))
+
+def process_market_phase(data):
+    """Lägger till MarketPhase, CycleDay, CycleEvent, Cycle Top och Cycle Bottom i data."""
+    return _assign_phase_columns(data, compute_market_phase(*_phase_inputs(data)))
+
+def _assign_phase_columns(data, result):
+    event = np.full(len(data), None, dtype=object)
+    event[~np.isnan(result["cycle_top"])] = "top"
+    event[~np.isnan(result["cycle_bottom"])] = "bottom"
+
+    data["MarketPhase"] = PHASE_NAMES[result["phase"]]
+    data["CycleDay"] = result["cycle_day"]
+    data["CycleEvent"] = event
+    data["Cycle Top"] = result["cycle_top"]
+    data["Cycle Bottom"] = result["cycle_bottom"]
+    return data
+
+#############################
+# Batch-läge: många tickers samtidigt
+#############################
+
+class PhaseState:
+    """
+    Fasmaskinens tillstånd för N tickers. Varje anrop till step() behandlar
+    en dag för alla tickers samtidigt med samma regler som compute_market_phase.
+    """
+
+    def __init__(self, n_tickers):
+        self.position = -1                                      # Senast behandlade dag
+        self.current = np.zeros(n_tickers, dtype=np.int8)       # 0 = ingen fas ännu
+        self.start = np.full(n_tickers, -1, dtype=np.int64)     # Fasens startdag
+        # Högsta/lägsta Close sedan fasens start (första förekomsten vinner)
+        self.max_value = np.full(n_tickers, np.nan)
+        self.max_index = np.full(n_tickers, -1, dtype=np.int64)
+        self.min_value = np.full(n_tickers, np.nan)
+        self.min_index = np.full(n_tickers, -1, dtype=np.int64)
+        # Senaste bekräftade topp/botten
+        self.top_index = np.full(n_tickers, -1, dtype=np.int64)
+        self.top_value = np.full(n_tickers, np.nan)
+        self.bottom_index = np.full(n_tickers, -1, dtype=np.int64)
+        self.bottom_value = np.full(n_tickers, np.nan)
+        # Fas och CycleDay för senast behandlade dag
+        self.phase = np.zeros(n_tickers, dtype=np.int8)
+        self.cycle_day = np.zeros(n_tickers, dtype=np.int64)
+
+    def step(self, close, signal):
+        """Behandlar nästa dag. Returnerar (tops, bottoms): masker för bekräftade vändpunkter."""
+        t = self.position + 1
+        close = np.asarray(close, dtype=float)
+        defined = signal != UNDEFINED
+        active = self.current != UNDEFINED
+
+        new = defined & ~active
+        differ = defined & active & (signal != self.current)
+        duration = t - self.start
+        demote = differ & (duration < MIN_CONFIRMED_DAYS)
+        confirm = differ & (duration >= MIN_CONFIRMED_DAYS)
+
+        # Vändpunkter avser fasen [start, t-1], dvs. före dagens stängning
+        tops = confirm & (self.current == UPTREND)
+        bottoms = confirm & (self.current == DOWNTREND)
+        self.top_index[tops] = self.max_index[tops]
+        self.top_value[tops] = self.max_value[tops]
+        self.bottom_index[bottoms] = self.min_index[bottoms]
+        self.bottom_value[bottoms] = self.min_value[bottoms]
+
+        self.current[demote] = CHOPPY
+        reset = new | confirm
+        self.current[reset] = signal[reset]
+        self.start[reset] = t
+
+        # Uppdatera extremvärden sedan fasstart (även odefinierade dagar räknas)
+        running = (self.current != UNDEFINED) & ~reset
+        higher = running & (close > self.max_value)
+        lower = running & (close < self.min_value)
+        self.max_value[higher] = close[higher]
+        self.max_index[higher] = t
+        self.min_value[lower] = close[lower]
+        self.min_index[lower] = t
+        self.max_value[reset] = close[reset]
+        self.min_value[reset] = close[reset]
+        self.max_index[reset] = t
+        self.min_index[reset] = t
+
+        self.phase = np.where(defined, self.current, UNDEFINED).astype(np.int8)
+        self.cycle_day = np.where(defined, t - self.start + 1, 0)
+        self.position = t
+        return tops, bottoms
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def to_dict(self):
+        state = {name: value.tolist() if isinstance(value, np.ndarray) else value
+                 for name, value in vars(self).items()}
+        state["dtypes"] = {name: str(value.dtype) for name, value in vars(self).items()
+                           if isinstance(value, np.ndarray)}
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        phase_state = cls.__new__(cls)
+        for name, value in state.items():
+            if name == "dtypes":
+                continue
+            dtype = state["dtypes"].get(name)
+            setattr(phase_state, name, np.array(value, dtype=dtype) if dtype else value)
+        return phase_state
+
+    @classmethod
+    def from_result(cls, close, result):
+        """
+        Tillståndet efter sista dagen i close, för en ticker, härlett från
+        compute_market_phase() i stället för att stega igenom hela historiken.
+        """
+        close = np.asarray(close, dtype=float)
+        state = cls(1)
+        state.position = len(close) - 1
+        if not result["segments"]:
+            return state
+        start, current, choppy_from, _ = result["segments"][-1]
+        state.current[0] = CHOPPY if choppy_from is not None else current
+        state.start[0] = start
+        window = close[start:]
+        if not np.isnan(window).all():
+            # Utan kurser i segmentet (ny ticker, lucka i data) lämnas extremerna osatta
+            state.max_index[0] = start + np.nanargmax(window)
+            state.min_index[0] = start + np.nanargmin(window)
+            state.max_value[0] = close[state.max_index[0]]
+            state.min_value[0] = close[state.min_index[0]]
+        tops = np.flatnonzero(~np.isnan(result["cycle_top"]))
+        bottoms = np.flatnonzero(~np.isnan(result["cycle_bottom"]))
+        if len(tops):
+            state.top_index[0] = tops[-1]
+            state.top_value[0] = result["cycle_top"][tops[-1]]
+        if len(bottoms):
+            state.bottom_index[0] = bottoms[-1]
+            state.bottom_value[0] = result["cycle_bottom"][bottoms[-1]]
+        state.phase[0] = result["phase"][-1]
+        state.cycle_day[0] = result["cycle_day"][-1]
+        return state
+
+#############################
+# Inkrementell fasberäkning för en tidsserie
+#############################
+# Fastabellen och tillståndet (före sista raden) sparas i data/phases. När en
+# ny dag tillkommer stegas bara den (och den senast sparade dagen, som kan ha
+# varit en intradagskurs) i stället för att hela historiken körs om.
+
+def _phase_path(name):
+    return os.path.join(PHASE_DIR, f"{name}.parquet")
+
+def _load_phase_table(name):
+    return table_store.load(_phase_path(name))
+
+def _save_phase_table(name, table, saved):
+    table_store.save(_phase_path(name), table, saved)
+
+def _step_single(state, close, signal):
+    # Stegar en dag för en ticker; returnerar vändpunkter som (kolumn, position, värde)
+    tops, bottoms = state.step(close, signal)
+    events = []
+    if tops[0]:
+        events.append(("top", int(state.top_index[0]), float(state.top_value[0])))
+    if bottoms[0]:
+        events.append(("bottom", int(state.bottom_index[0]), float(state.bottom_value[0])))
+    return events
+
+def _dates_of(data):
+    return pd.DatetimeIndex(data["Date"] if "Date" in data.columns else data.index)
+
+def update_market_phase(name, data):
+    """
+    Som process_market_phase(), men fasmaskinens tillstånd sparas under name.
+    Är historiken oförändrad stegas bara dagarna från och med den senast sparade;
+    annars räknas allt om och tillståndet sparas på nytt.
+    """
+    close, ma20, deviation = _phase_inputs(data)
+    signal = classify_signal(close, ma20, deviation)
+    dates = _dates_of(data)
+    n = len(data)
+    if n < 2:
+        return process_market_phase(data)
+
+    table, saved = _load_phase_table(name)
+    kept = len(table) - 1 if table is not None else 0
+    if table is not None and saved.get("rows") == len(table) and 1 <= kept < n \
+            and dates[:kept].equals(table.index[:kept]) \
+            and np.array_equal(close[:kept], table["Close"].to_numpy()[:kept], equal_nan=True):
+        if kept == n - 1 and dates[-1] == table.index[-1] and close[-1] == table["Close"].iloc[-1]:
+            result = {col: table[col].to_numpy() for col in ("phase", "cycle_day", "cycle_top", "cycle_bottom")}
+            return _assign_phase_columns(data, result)
+        phase = np.concatenate([table["phase"].to_numpy()[:kept], np.zeros(n - kept, dtype=np.int8)])
+        cycle_day = np.concatenate([table["cycle_day"].to_numpy()[:kept], np.zeros(n - kept, dtype=np.int64)])
+        cycle_top = np.concatenate([table["cycle_top"].to_numpy()[:kept], np.full(n - kept, np.nan)])
+        cycle_bottom = np.concatenate([table["cycle_bottom"].to_numpy()[:kept], np.full(n - kept, np.nan)])
+        # Vändpunkter som bara den sparade sista raden bekräftade tas bort och stegas om
+        targets = {"top": cycle_top, "bottom": cycle_bottom}
+        for column, position, _ in saved["pending"]:
+            targets[column][position] = np.nan
+        state = PhaseState.from_dict(saved["state"])
+        for t in range(kept, n):
+            if t == n - 1:
+                checkpoint = state.copy()
+            events = _step_single(state, close[t:t + 1], signal[t:t + 1])
+            for column, position, value in events:
+                targets[column][position] = value
+            phase[t] = state.phase[0]
+            cycle_day[t] = state.cycle_day[0]
+        result = {"phase": phase, "cycle_day": cycle_day, "cycle_top": cycle_top, "cycle_bottom": cycle_bottom}
+    else:
+        result = compute_market_phase(close, ma20, deviation)
+        checkpoint = PhaseState.from_result(close[:-1], compute_market_phase(close[:-1], ma20[:-1], deviation[:-1]))
+        events = _step_single(checkpoint.copy(), close[-1:], signal[-1:])
+
+    table = pd.DataFrame({"Close": close, "phase": result["phase"], "cycle_day": result["cycle_day"],
+                          "cycle_top": result["cycle_top"], "cycle_bottom": result["cycle_bottom"]},
+                         index=dates)
+    _save_phase_table(name, table, {"rows": n, "state": checkpoint.to_dict(), "pending": events})
+    return _assign_phase_columns(data, result)
+
+def add_indicator_matrices(closes):
+    """MA20, MA200 och Deviation för en prismatris (datum × tickers)."""
+    ma20 = closes.rolling(window=20).mean()
+    ma200 = closes.rolling(window=200).mean()
+    deviation = ((closes - ma20).abs() / ma20).where(ma20.notna())
+    return ma20, ma200, deviation
+
+def classify_universe(closes):
+    """
+    Kör fasklassificeringen på en hel prismatris (datum × tickers) i ett svep.
+    Returnerar (summary, counts):
+      summary: per ticker aktuell fas, CycleDay, långsiktig trend och senaste topp/botten
+      counts:  per dag antal tickers i respektive fas
+    """
+    ma20, ma200, deviation = add_indicator_matrices(closes)
+    close_values = closes.to_numpy(dtype=float)
+    signal = classify_signal(close_values, ma20.to_numpy(dtype=float), deviation.to_numpy(dtype=float))
+
+    n_days, n_tickers = close_values.shape
+    state = PhaseState(n_tickers)
+    counts = np.zeros((n_days, len(PHASE_NAMES)), dtype=np.int64)
+    for t in range(n_days):
+        state.step(close_values[t], signal[t])
+        counts[t] = np.bincount(state.phase, minlength=len(PHASE_NAMES))
+
+    dates = closes.index
+    latest_close = closes.ffill().iloc[-1] if n_days else pd.Series(np.nan, index=closes.columns)
+    latest_ma200 = ma200.iloc[-1] if n_days else pd.Series(np.nan, index=closes.columns)
+
+    def _dates(index):
+        return pd.DatetimeIndex([dates[i] if i >= 0 else pd.NaT for i in index])
+
+    summary = pd.DataFrame({
+        "Phase": PHASE_NAMES[state.phase],
+        "CycleDay": state.cycle_day,
+        "LongTermTrend": np.where(latest_close >= latest_ma200, "bull", "bear"),
+        "Last Top Date": _dates(state.top_index),
+        "Last Top": state.top_value,
+        "Last Bottom Date": _dates(state.bottom_index),
+        "Last Bottom": state.bottom_value,
+    }, index=closes.columns)
+    summary.index.name = "Ticker"
+    counts = pd.DataFrame(counts, index=dates, columns=PHASE_NAMES)
+    return summary, counts
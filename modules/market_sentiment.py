@@ -1,108 +1,176 @@
+from functools import lru_cache
 import dash
 from dash import dcc, html
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
+from modules import datagraph, scheduler
 
 #############################
 # Data & Preprocessing
 #############################
 
+HISTORY_YEARS = 10   # År som visas; lätt läge (se create_candlestick_chart) håller figuren liten
+
 def fetch_data():
-    ticker = "QQQ"
-    # Hämtar data för perioden 2024-01-01 till 2025-12-31 (anpassa vid behov)
-    data = yf.download(ticker, start="2024-01-01", end="2025-12-31")
-    data.reset_index(inplace=True)
-    
-    # Om datan har MultiIndex plattas den ut
-    if isinstance(data.columns, pd.MultiIndex):
-        data.columns = [col[0] if isinstance(col, tuple) else col for col in data.columns]
-    
-    # Beräkna MA200 för långsiktig trendbedömning
-    data["MA200"] = data["Close"].rolling(window=200).mean()
-    # Beräkna MA20 för kortsiktiga signaler
-    data["MA20"] = data["Close"].rolling(window=20).mean()
-    # Beräkna relativ avvikelse (absolut procentuell skillnad mellan Close och MA20)
-    data["Deviation"] = np.where(data["MA20"].notna(),
-                                 abs(data["Close"] - data["MA20"]) / data["MA20"],
-                                 np.nan)
-    # Långsiktig trend: bull om Close >= MA200, annars bear
-    data["LongTermTrend"] = np.where(data["Close"] >= data["MA200"], "bull", "bear")
+    # QQQ med MA20, MA200, Deviation, LongTermTrend och marknadsfas från den delade
+    # beroendegrafen (beräknas över hela historiken, en gång per dataversion)
+    data = datagraph.get("qqq_phase")
+    # Visar de senaste HISTORY_YEARS åren fram till senaste handelsdagen
+    if len(data):
+        data = data[data.index >= data.index[-1] - pd.DateOffset(years=HISTORY_YEARS)]
+    data = data.reset_index()
     return data
 
-def process_market_phase(data):
-    # Tröskelvärden för att bekräfta fasen
-    MIN_CONFIRMED_DAYS = 6    # Signal måste vara konsekvent i minst 6 dagar
-    THRESHOLD = 0.02          # Minsta avvikelse från MA20 (2%)
-
-    # Skapa nya kolumner
-    data["MarketPhase"] = None   # "uptrend", "downtrend", "choppy" eller "undefined"
-    data["CycleDay"] = 0         # Antal dagar i den aktuella fasen
-    data["CycleEvent"] = None    # "top" (vid uptrend) eller "bottom" (vid downtrend)
-    # Skapa även kolumner för att spara det faktiska Close-värdet vid vändpunkten
-    data["Cycle Top"] = np.nan
-    data["Cycle Bottom"] = np.nan
-
-    current_phase = None
-    phase_start_index = None
-
-    for i, row in data.iterrows():
-        if pd.isna(row["MA20"]) or pd.isna(row["Deviation"]):
-            data.at[i, "MarketPhase"] = "undefined"
-            data.at[i, "CycleDay"] = 0
-            data.at[i, "CycleEvent"] = None
-            continue
+#######################################
+# Visualization: Candlestick Chart med fasmarkeringar
+#######################################
+DETAIL_DAYS = 365   # Lätt läge: dagliga staplar för senaste året, veckostaplar för äldre data
+PHASE_COLORS = {
+    "uptrend": "rgba(144,238,144,0.5)",    # ljusgrön
+    "downtrend": "rgba(255,182,193,0.5)",  # ljusröd
+    "choppy": "rgba(211,211,211,0.5)",     # ljusgrå
+}
 
-        if row["Close"] > row["MA20"] and row["Deviation"] >= THRESHOLD:
-            signal = "uptrend"
-        elif row["Close"] < row["MA20"] and row["Deviation"] >= THRESHOLD:
-            signal = "downtrend"
-        else:
-            signal = "choppy"
+def downsample_bars(data, detail_days=DETAIL_DAYS):
+    """Veckostaplar för allt äldre än detail_days före sista dagen, dagliga staplar därefter."""
+    dates = pd.DatetimeIndex(data["Date"])
+    older = dates < dates[-1] - pd.Timedelta(days=detail_days)
+    if not older.any():
+        return data
+    old = data[older]
+    weeks = pd.DatetimeIndex(old["Date"]).to_period("W-FRI")
+    weekly = old.groupby(weeks).agg(
+        Date=("Date", "first"), Open=("Open", "first"), High=("High", "max"),
+        Low=("Low", "min"), Close=("Close", "last"), MA20=("MA20", "last"),
+        MarketPhase=("MarketPhase", "last")
+    )
+    columns = list(weekly.columns)
+    return pd.concat([weekly.reset_index(drop=True), data.loc[~older, columns]], ignore_index=True)
 
-        if current_phase is None:
-            current_phase = signal
-            phase_start_index = i
-            data.at[i, "MarketPhase"] = current_phase
-            data.at[i, "CycleDay"] = 1
-        else:
-            if signal == current_phase:
-                data.at[i, "MarketPhase"] = current_phase
-                data.at[i, "CycleDay"] = i - phase_start_index + 1
-            else:
-                duration = i - phase_start_index
-                if duration < MIN_CONFIRMED_DAYS:
-                    current_phase = "choppy"
-                    data.at[i, "MarketPhase"] = current_phase
-                    data.at[i, "CycleDay"] = duration + 1
-                else:
-                    phase_data = data.loc[phase_start_index:i-1]
-                    if current_phase == "uptrend":
-                        idx = phase_data["Close"].idxmax()
-                        data.at[idx, "CycleEvent"] = "top"
-                        data.at[idx, "Cycle Top"] = data.at[idx, "Close"]
-                    elif current_phase == "downtrend":
-                        idx = phase_data["Close"].idxmin()
-                        data.at[idx, "CycleEvent"] = "bottom"
-                        data.at[idx, "Cycle Bottom"] = data.at[idx, "Close"]
-                    current_phase = signal
-                    phase_start_index = i
-                    data.at[i, "MarketPhase"] = current_phase
-                    data.at[i, "CycleDay"] = 1
-    return data
+def _day_strings(dates):
+    # "2024-01-02" i stället för fullständiga tidsstämplar halverar datumfälten i JSON
+    return np.datetime_as_string(pd.DatetimeIndex(dates).to_numpy(), unit="D")
 
-# Hämta och processa data
-data = fetch_data()
-data = process_market_phase(data)
+def _float32(values):
+    # Kurser behöver inte mer än sju siffror; skickas som binära float32-arrayer
+    return values.to_numpy(dtype=np.float32)
 
-#######################################
-# Visualization: Candlestick Chart med fasmarkeringar
-#######################################
+def _phase_background(bars, low, high):
+    # En fylld yta per fas i stället för en layout-shape per fasperiod
+    phase = bars["MarketPhase"].to_numpy()
+    dates = _day_strings(bars["Date"]).astype(object)
+    starts = np.concatenate([[0], np.flatnonzero(phase[1:] != phase[:-1]) + 1])
+    ends = np.append(starts[1:], len(bars) - 1)   # Perioden fortsätter till nästa periods start
+    traces = []
+    for name, color in PHASE_COLORS.items():
+        selected = phase[starts] == name
+        if not selected.any():
+            continue
+        x0, x1 = dates[starts[selected]], dates[ends[selected]]
+        gap = np.full(len(x0), None)
+        x = np.column_stack([x0, x0, x1, x1, gap]).ravel()
+        y = np.tile([low, high, high, low, None], len(x0))
+        traces.append(go.Scatter(
+            x=x, y=y, fill="toself", fillcolor=color, mode="none",
+            hoverinfo="skip", showlegend=False, name=name
+        ))
+    return traces
 
-def create_candlestick_chart(data):
+def _light_traces(data):
+    bars = downsample_bars(data)
+    low, high = bars["Low"].min(), bars["High"].max()
+    pad = (high - low) * 0.02
+    traces = _phase_background(bars, round(low - pad, 2), round(high + pad, 2))
+    dates = _day_strings(bars["Date"])
+    traces.append(go.Candlestick(
+        x=dates,
+        open=_float32(bars["Open"]),
+        high=_float32(bars["High"]),
+        low=_float32(bars["Low"]),
+        close=_float32(bars["Close"]),
+        increasing_line_color="green",
+        decreasing_line_color="red",
+        name="Candlesticks"
+    ))
+    # Linjer och markörer ritas med WebGL; bara dagar med vändpunkter skickas
+    traces.append(go.Scattergl(
+        x=dates, y=_float32(bars["MA20"]), mode="lines",
+        line=dict(color="blue", width=1), name="MA20",
+        hovertemplate="MA20: %{y:.2f}<extra></extra>"
+    ))
+    tops = data[data["Cycle Top"].notna()]
+    bottoms = data[data["Cycle Bottom"].notna()]
+    traces.append(go.Scattergl(
+        x=_day_strings(tops["Date"]), y=tops["Cycle Top"], mode="markers",
+        marker=dict(symbol="triangle-down", size=10, color="red"),
+        name="Cycle Top", hovertemplate="Cycle Top: %{y:.2f}<extra></extra>"
+    ))
+    traces.append(go.Scattergl(
+        x=_day_strings(bottoms["Date"]), y=bottoms["Cycle Bottom"], mode="markers",
+        marker=dict(symbol="triangle-up", size=10, color="green"),
+        name="Cycle Bottom", hovertemplate="Cycle Bottom: %{y:.2f}<extra></extra>"
+    ))
+    return traces
+
+def create_candlestick_chart(data, light=True):
+    """
+    Candlestick-graf med fasbakgrund. Lätt läge (standard): veckostaplar för äldre
+    data, fasbakgrund som tre fyllda ytor och WebGL för linjer/markörer, vilket
+    ger en liten figur även för många års historik. light=False ritar alla dagar
+    och en bakgrundsmarkering per fasperiod.
+    """
     fig = go.Figure()
+    if light:
+        fig.add_traces(_light_traces(data))
+    else:
+        _add_full_traces(fig, data)
+
+    # Lägg till annotation med aktuell fas och CycleDay
+    latest = data.iloc[-1]
+    annotation_text = (
+        f"Phase: {latest['MarketPhase']}<br>"
+        f"CycleDay: {latest['CycleDay']}<br>"
+        f"Event: {latest['CycleEvent'] if pd.notna(latest['CycleEvent']) else ''}"
+    )
     
+    fig.update_layout(
+        title="Market Cycle - QQQ",
+        xaxis_title="Date",
+        yaxis_title="Price",
+        dragmode="pan",
+        hovermode="x",
+        template="plotly_white",
+        xaxis=dict(
+            rangeslider_visible=False,
+            rangeselector=dict(
+                buttons=[
+                    dict(count=1, label="1m", step="month", stepmode="backward"),
+                    dict(count=3, label="3m", step="month", stepmode="backward"),
+                    dict(count=6, label="6m", step="month", stepmode="backward"),
+                    dict(count=1, label="YTD", step="year", stepmode="todate"),
+                    dict(count=1, label="1y", step="year", stepmode="backward"),
+                    dict(step="all")
+                ]
+            )
+        ),
+        annotations=[{
+            "xref": "paper",
+            "yref": "paper",
+            "x": 1,
+            "y": 1,
+            "xanchor": "right",
+            "yanchor": "top",
+            "text": annotation_text,
+            "font": {"size": 12, "color": "black"},
+            "bgcolor": "white",
+            "bordercolor": "black",
+            "borderwidth": 1
+        }]
+    )
+    return fig
+
+def _add_full_traces(fig, data):
     # Skapa en lista med egen hovertext för candlesticks (visar datum och Close)
     hover_text = [
         f"Date: {d.strftime('%Y-%m-%d')}<br>Close: {c:.2f}"
@@ -152,8 +220,8 @@ def create_candlestick_chart(data):
     ))
     
     # Lägg till bakgrundsmarkeringar (vrects) för de olika marknadsfaserna
-    data["PhaseGroup"] = (data["MarketPhase"] != data["MarketPhase"].shift()).cumsum()
-    for _, group in data.groupby("PhaseGroup"):
+    phase_group = (data["MarketPhase"] != data["MarketPhase"].shift()).cumsum()
+    for _, group in data.groupby(phase_group):
         phase = group["MarketPhase"].iloc[0]
         start_date = group["Date"].iloc[0]
         end_date = group["Date"].iloc[-1]
@@ -169,59 +237,35 @@ def create_candlestick_chart(data):
             x0=start_date, x1=end_date,
             fillcolor=color, opacity=0.5, layer="below", line_width=0
         )
-    
-    # Lägg till annotation med aktuell fas och CycleDay
-    latest = data.iloc[-1]
-    annotation_text = (
-        f"Phase: {latest['MarketPhase']}<br>"
-        f"CycleDay: {latest['CycleDay']}<br>"
-        f"Event: {latest['CycleEvent'] if pd.notna(latest['CycleEvent']) else ''}"
-    )
-    
-    fig.update_layout(
-        title="Market Cycle - QQQ",
-        xaxis_title="Date",
-        yaxis_title="Price",
-        dragmode="pan",
-        hovermode="x",
-        template="plotly_white",
-        xaxis=dict(
-            rangeslider_visible=False,
-            rangeselector=dict(
-                buttons=[
-                    dict(count=1, label="1m", step="month", stepmode="backward"),
-                    dict(count=3, label="3m", step="month", stepmode="backward"),
-                    dict(count=6, label="6m", step="month", stepmode="backward"),
-                    dict(count=1, label="YTD", step="year", stepmode="todate"),
-                    dict(count=1, label="1y", step="year", stepmode="backward"),
-                    dict(step="all")
-                ]
-            )
-        ),
-        annotations=[{
-            "xref": "paper",
-            "yref": "paper",
-            "x": 1,
-            "y": 1,
-            "xanchor": "right",
-            "yanchor": "top",
-            "text": annotation_text,
-            "font": {"size": 12, "color": "black"},
-            "bgcolor": "white",
-            "bordercolor": "black",
-            "borderwidth": 1
-        }]
-    )
-    return fig
 
-# För visualisering: skapa figuren
-candlestick_chart = create_candlestick_chart(data)
+def build_market_sentiment_chart():
+    data = fetch_data()
+    return create_candlestick_chart(data)
 
-# Definiera layouten för Market Sentiment-sidan
-layout = html.Div([
-    html.H1("Market Sentiment", style={"textAlign": "center", "marginTop": "20px"}),
-    dcc.Graph(
-        id="market-sentiment-chart",
-        figure=candlestick_chart
-    )
-])
+# Bakgrundsjobb: färdig figur för Market Sentiment-sidan
+scheduler.register_job("market_sentiment", build_market_sentiment_chart)
+
+# Utan bakgrundsjobb byggs figuren först när sidan besöks och sparas sedan
+# per dag, så att en otillgänglig datakälla inte hindrar servern från att starta
+@lru_cache(maxsize=1)
+def _build_chart(day):
+    return build_market_sentiment_chart()
+
+def get_layout():
+    try:
+        candlestick_chart = scheduler.get_result("market_sentiment")
+        if candlestick_chart is None:
+            candlestick_chart = _build_chart(pd.Timestamp.today().date())
+        return html.Div([
+            html.H1("Market Sentiment", style={"textAlign": "center", "marginTop": "20px"}),
+            dcc.Graph(
+                id="market-sentiment-chart",
+                figure=candlestick_chart
+            )
+        ])
+    except Exception as e:
+        print(f"❌ Kunde inte bygga Market Sentiment: {e}")
+        return html.Div([
+            html.H1("Market Sentiment", style={"textAlign": "center", "marginTop": "20px"}),
+            html.H3("Ingen data tillgänglig just nu", style={"textAlign": "center", "color": "red"})
+        ])
@@ -0,0 +1,132 @@
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+# --------------------------------------------------
+# Mätvärden: tidsspann, räknare och histogram
+# --------------------------------------------------
+# Callbacks och datalagret rapporterar hit i stället för att skriva ut
+# förloppsmeddelanden. Allt hålls i minnet (ett lås, några dict-uppslag per
+# mätning) och visas i Prometheus textformat på /metrics.
+#
+#   with metrics.span("fetch"): ...                   -> histogram per callback och steg
+#   metrics.count("cache_hits_total", cache="returns") -> räknare, per callback
+#   metrics.observe("download_tickers", 120)          -> eget histogram
+
+PREFIX = "marketbreadth_"
+# Sekunder; täcker allt från cacheuppslag till kall nedladdning
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_counters = {}    # (namn, etiketter) -> värde
+_histograms = {}  # (namn, etiketter) -> [gränser, antal per hink, summa, antal]
+_local = threading.local()
+
+def current_callback():
+    """Namnet på callbacken som körs i den här tråden (eller None)."""
+    return getattr(_local, "callback", None)
+
+def _caller():
+    return current_callback() or "background"
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, amount=1, **labels):
+    """Ökar en räknare."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def count(name, amount=1, **labels):
+    """Som inc(), men med aktuell callback (eller "background") som etikett."""
+    inc(name, amount, callback=_caller(), **labels)
+
+def observe(name, value, buckets=BUCKETS, **labels):
+    """Lägger till ett värde i ett histogram."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+        for i, bound in enumerate(histogram[0]):
+            if value <= bound:
+                histogram[1][i] += 1
+                break
+        histogram[2] += value
+        histogram[3] += 1
+
+@contextmanager
+def span(stage, callback=None):
+    """Tar tid på ett steg (t.ex. fetch, compute, render) i aktuell callback eller ett jobb."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("span_seconds", time.perf_counter() - start, callback=callback or _caller(), stage=stage)
+
+def instrument(name):
+    """Dekorator för callbacks: total tid, anrop och fel per callback."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            previous = current_callback()
+            _local.callback = name
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                inc("callback_errors_total", callback=name)
+                raise
+            finally:
+                observe("callback_seconds", time.perf_counter() - start, callback=name)
+                _local.callback = previous
+        return wrapper
+    return decorate
+
+#############################
+# Prometheus-format
+#############################
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def render():
+    """Alla mätvärden i Prometheus textformat."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (h[0], list(h[1]), h[2], h[3]) for key, h in _histograms.items()}
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {PREFIX}{name} counter")
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for (histogram, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+            if histogram != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{PREFIX}{name}_bucket{_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+def register_endpoint(server, path="/metrics"):
+    """Lägger till /metrics på Flask-servern bakom Dash."""
+    from flask import Response
+    server.add_url_rule(path, "metrics", lambda: Response(render(), mimetype="text/plain; version=0.0.4"))
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
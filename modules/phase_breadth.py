@@ -0,0 +1,105 @@
+import dash
+from dash import dcc, html, dash_table
+from dash.dependencies import Input, Output
+import pandas as pd
+import plotly.express as px
+from modules import metrics, price_store
+from modules.market_phase import classify_universe
+from modules.sector_leaders import SECTOR_TICKERS
+from modules.constituents import get_sp500_tickers
+
+# --------------------------------------------------
+# Fasbredd: hur många tickers är i uptrend/downtrend/choppy
+# --------------------------------------------------
+UNIVERSES = {
+    "sectors": ("Sektor-ETF:er", lambda: SECTOR_TICKERS),
+    "sp500": ("S&P 500", get_sp500_tickers),
+}
+HISTORY_START = "2023-01-01"   # MA200 behöver ca ett års historik innan första klassificeringen
+PHASE_COLORS = {
+    "uptrend": "rgba(144,238,144,0.9)",
+    "downtrend": "rgba(255,182,193,0.9)",
+    "choppy": "rgba(211,211,211,0.9)",
+    "undefined": "rgba(255,255,255,0.9)",
+}
+
+def fetch_phase_breadth(universe="sectors"):
+    tickers = UNIVERSES[universe][1]()
+    closes = price_store.get_field_matrix(tickers, "Close", start=HISTORY_START)
+    if closes.empty:
+        return None, None
+    return classify_universe(closes)
+
+layout = html.Div([
+    html.H1("Fasbredd", style={"textAlign": "center"}),
+    html.Div([
+        html.Button("Sektor-ETF:er", id="phase-btn-sectors", n_clicks=0, style={"margin": "5px"}),
+        html.Button("S&P 500", id="phase-btn-sp500", n_clicks=0, style={"margin": "5px"}),
+    ], style={"display": "flex", "justifyContent": "center", "flexWrap": "wrap"}),
+    html.H3(id="selected-universe-phase", style={"textAlign": "center"}),
+    dcc.Loading(
+        id="loading-phase-breadth",
+        type="default",
+        children=[
+            dcc.Graph(id="phase-breadth-graph"),
+            dash_table.DataTable(
+                id="phase-breadth-table",
+                page_size=25,
+                sort_action="native",
+                style_cell={"textAlign": "center"}
+            )
+        ]
+    )
+])
+
+def get_layout():
+    return layout
+
+def register_callbacks(app):
+    @app.callback(
+        [Output("phase-breadth-graph", "figure"),
+         Output("phase-breadth-table", "data"),
+         Output("phase-breadth-table", "columns"),
+         Output("selected-universe-phase", "children")],
+        [Input("phase-btn-sectors", "n_clicks"),
+         Input("phase-btn-sp500", "n_clicks")]
+    )
+    @metrics.instrument("update_phase_breadth")
+    def update_phase_breadth(n_sectors, n_sp500):
+        ctx = dash.callback_context
+        if not ctx.triggered:
+            universe = "sectors"
+        else:
+            universe = ctx.triggered[0]["prop_id"].split(".")[0].replace("phase-btn-", "")
+        selected_text = f"Valt universum: {UNIVERSES[universe][0]}"
+
+        with metrics.span("fetch"):
+            summary, counts = fetch_phase_breadth(universe)
+        if summary is None:
+            return px.area(title="Ingen data tillgänglig"), [], [], selected_text
+
+        phases = ["uptrend", "choppy", "downtrend"]
+        fig = px.area(
+            counts[phases].reset_index(),
+            x="Date",
+            y=phases,
+            color_discrete_map=PHASE_COLORS,
+            title=f"Antal tickers per fas - {UNIVERSES[universe][0]}",
+            labels={"Date": "Datum", "value": "Antal", "variable": "Fas"}
+        )
+        latest = counts.iloc[-1]
+        selected_text += (f" | Uptrend: {latest['uptrend']}, Choppy: {latest['choppy']}, "
+                          f"Downtrend: {latest['downtrend']}")
+
+        table = summary.reset_index()
+        for col in ["Last Top Date", "Last Bottom Date"]:
+            table[col] = table[col].dt.strftime("%Y-%m-%d")
+        table = table.round(2)
+        columns = [{"name": col, "id": col} for col in table.columns]
+        return fig, table.to_dict("records"), columns, selected_text
+
+if __name__ == "__main__":
+    app = dash.Dash(__name__)
+    app.layout = get_layout()
+    register_callbacks(app)
+    app.run_server(debug=True)
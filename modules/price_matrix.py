@@ -0,0 +1,122 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from modules.panel import DTYPE
+
+# --------------------------------------------------
+# Publicerade prismatriser (datum × tickers) som minnesmappade filer
+# --------------------------------------------------
+# Ingest-processen (modules/ingest.py) skriver en ny version av matriserna
+# efter varje uppdatering:
+#
+#   matrices/<version>/dates.npy       datetime64[D], gemensamma datum
+#   matrices/<version>/tickers.json    kolumnordning
+#   matrices/<version>/<fält>.npy      en fil per fält: kurser float32 (som PricePanel),
+#                                      Volume float64 (float32 tappar siffror över ~1e7)
+#   matrices/CURRENT                   namnet på senaste kompletta versionen
+#
+# En version skrivs klart i en egen katalog innan CURRENT byts atomiskt, så
+# en läsare ser alltid en hel version. Webbprocesserna mappar filerna
+# skrivskyddat (np.load med mmap_mode="r"): sidorna i minnet delas mellan
+# alla processer via operativsystemets filcache i stället för att varje
+# process håller egna kopior.
+
+FIELDS = ("Close", "Adj Close", "Volume")
+FIELD_DTYPES = {"Volume": np.float64}   # Övriga fält: DTYPE (float32)
+KEEP_VERSIONS = 3   # Äldre versioner tas bort; de senaste kan fortfarande vara mappade
+
+def _field_file(field):
+    return field.lower().replace(" ", "_") + ".npy"
+
+def _current_path(directory):
+    return os.path.join(directory, "CURRENT")
+
+def publish(directory, frames, tickers, fields=FIELDS):
+    """
+    Skriver frames (ticker -> DataFrame med Date-index) som en ny version med
+    kolumnerna i tickers ordning och gör den till CURRENT. Returnerar versionens namn.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    indexes = [frames[t].index for t in tickers if t in frames and not frames[t].empty]
+    dates = indexes[0].append(indexes[1:]).unique().sort_values() if indexes else pd.DatetimeIndex([])
+    version = pd.Timestamp.now(tz="UTC").strftime("%Y%m%dT%H%M%S%f")
+    os.makedirs(directory, exist_ok=True)
+    tmp_dir = os.path.join(directory, version + ".tmp")
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "dates.npy"), dates.to_numpy().astype("datetime64[D]"))
+    with open(os.path.join(tmp_dir, "tickers.json"), "w") as f:
+        json.dump(tickers, f)
+    for field in fields:
+        matrix = np.full((len(dates), len(tickers)), np.nan, dtype=FIELD_DTYPES.get(field, DTYPE))
+        for column, ticker in enumerate(tickers):
+            df = frames.get(ticker)
+            if df is None or df.empty:
+                continue
+            matrix[dates.get_indexer(df.index), column] = df[field].to_numpy()
+        np.save(os.path.join(tmp_dir, _field_file(field)), matrix)
+    os.rename(tmp_dir, os.path.join(directory, version))
+    tmp_path = _current_path(directory) + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, _current_path(directory))
+    _remove_old_versions(directory, version)
+    return version
+
+def _remove_old_versions(directory, current):
+    versions = sorted(name for name in os.listdir(directory)
+                      if os.path.isdir(os.path.join(directory, name)) and not name.endswith(".tmp"))
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != current:
+            # Processer som fortfarande har filerna mappade behåller dem tills de mappar om
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+def current_version(directory):
+    """Namnet på senaste publicerade versionen, eller None."""
+    try:
+        with open(_current_path(directory)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+class MappedPrices:
+    """En publicerad version, mappad skrivskyddat. Matriserna får inte ändras."""
+
+    def __init__(self, directory, version):
+        path = os.path.join(directory, version)
+        self.version = version
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(path, "dates.npy")).astype("datetime64[ns]"), name="Date")
+        with open(os.path.join(path, "tickers.json")) as f:
+            self.tickers = json.load(f)
+        self.columns = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self._fields = {}
+        for field in FIELDS:
+            file = os.path.join(path, _field_file(field))
+            if os.path.exists(file):
+                self._fields[field] = np.load(file, mmap_mode="r")
+
+    def has(self, field):
+        return field in self._fields
+
+    def block(self, tickers, field="Close", start=None, end=None):
+        """(datum, tickers, array) för ett fält. Tickers som saknas utelämnas."""
+        values = self._fields[field]
+        present = [t for t in tickers if t in self.columns]
+        positions = [self.columns[t] for t in present]
+        first = self.dates.searchsorted(pd.Timestamp(start)) if start is not None else 0
+        last = self.dates.searchsorted(pd.Timestamp(end)) if end is not None else len(self.dates)
+        if positions and positions == list(range(positions[0], positions[0] + len(positions))):
+            # Sammanhängande kolumner (t.ex. hela S&P 500): en vy utan kopiering
+            block = values[first:last, positions[0]:positions[0] + len(positions)]
+        else:
+            block = values[first:last][:, positions]
+        return self.dates[first:last], present, block
+
+    def matrix(self, tickers, field="Close", start=None, end=None):
+        """Fält som DataFrame (datum × tickers). Tickers som saknas utelämnas."""
+        dates, present, block = self.block(tickers, field, start, end)
+        return pd.DataFrame(block, index=dates, columns=present, copy=False)
+
+def open_version(directory, version):
+    return MappedPrices(directory, version)
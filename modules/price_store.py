@@ -0,0 +1,293 @@
+import os
+import time
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from modules import metrics, price_matrix, providers
+from modules.panel import PricePanel
+from modules.scheduler import CLOSE_DELAY_MINUTES
+from modules.trading_calendar import is_market_open, last_closed_session
+
+# --------------------------------------------------
+# Lokal prisdatabas: en Parquet-fil per ticker
+# --------------------------------------------------
+# Alla moduler läser kurser härifrån. Endast de staplar som saknas sedan
+# senast sparade datum hämtas från leverantören (normalt Yahoo Finance) och
+# läggs till i filen. Om leverantören har justerat om historiken (split eller
+# utdelning) hämtas hela historiken om. Andra leverantörer än Yahoo får en egen
+# datakatalog.
+_DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DATA_DIR = os.environ.get(
+    "MARKETBREADTH_DATA_DIR",
+    _DEFAULT_DATA_DIR if providers.PROVIDER_NAME == "yahoo"
+    else os.path.join(_DEFAULT_DATA_DIR, providers.PROVIDER_NAME)
+)
+PRICE_DIR = os.path.join(DATA_DIR, "prices")
+MATRIX_DIR = os.path.join(DATA_DIR, "matrices")
+
+# "external": en separat ingest-process (python -m modules.ingest) hämtar all data
+# och publicerar matriser; den här processen kontaktar aldrig leverantören själv
+EXTERNAL_INGEST = os.environ.get("MARKETBREADTH_INGEST", "local") == "external"
+MAPPED_CHECK_SECONDS = 5       # Hur ofta CURRENT kontrolleras i external-läge
+
+HISTORY_START = "2005-01-01"   # Startdatum vid första nedladdningen av en ticker
+PRICE_FIELDS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+REFRESH_INTERVAL = 15 * 60     # Sekunder mellan två uppdateringskontroller per ticker
+
+_frames = {}        # ticker -> DataFrame i minnet (tickers som lästs med load_history)
+_stored_dates = {}  # ticker -> de två senast sparade datumen (för uppdateringskontrollen)
+_last_checked = {}  # ticker -> tidpunkt (time.time()) för senaste kontroll mot leverantören
+_check_lock = threading.Lock()
+_version = 0        # Ökas varje gång ny data sparas (används som cachenyckel)
+_failures = {}      # ticker -> (orsak, tidpunkt) för tickers vars senaste hämtning misslyckades
+_mapped = None      # price_matrix.MappedPrices i external-läge
+_mapped_checked = 0
+
+def _path(ticker):
+    # "^VIX" fungerar inte bra som filnamn överallt
+    return os.path.join(PRICE_DIR, f"{ticker.replace('^', '_')}.parquet")
+
+def _empty_frame():
+    return pd.DataFrame(columns=PRICE_FIELDS, index=pd.DatetimeIndex([], name="Date"), dtype=float)
+
+def load_history(ticker, keep=True):
+    """
+    Läser en tickers sparade historik (utan att kontakta leverantören).
+    Med keep=False sparas den inte i minnet (för block av stora universum).
+    """
+    if ticker in _frames:
+        return _frames[ticker]
+    path = _path(ticker)
+    df = pd.read_parquet(path) if os.path.exists(path) else _empty_frame()
+    if keep:
+        _frames[ticker] = df
+    return df
+
+def load_fields(ticker, fields):
+    """
+    Bara fälten fields ur en tickers sparade historik. Finns historiken redan
+    i minnet används den, annars läses bara de kolumnerna från filen (och sparas inte).
+    """
+    fields = list(fields)
+    if ticker in _frames:
+        return _frames[ticker][fields]
+    path = _path(ticker)
+    if not os.path.exists(path):
+        return _empty_frame()[fields]
+    # Direkt via pyarrow: pandas-metadatan gör read_parquet märkbart långsammare per fil
+    table = pq.read_table(path, columns=["Date"] + fields)
+    return pd.DataFrame({field: table.column(field).to_numpy() for field in fields},
+                        index=pd.DatetimeIndex(table.column("Date").to_numpy(), name="Date"))
+
+def _tail_dates(ticker):
+    # De två senast sparade datumen, utan att läsa in hela historiken
+    if ticker in _frames:
+        return _frames[ticker].index[-2:]
+    if ticker not in _stored_dates:
+        path = _path(ticker)
+        dates = pq.read_table(path, columns=["Date"]).column("Date").to_numpy() if os.path.exists(path) else []
+        _stored_dates[ticker] = pd.DatetimeIndex(dates[-2:])
+    return _stored_dates[ticker]
+
+def _saved_at(ticker):
+    # När tickerns fil senast skrevs (UTC)
+    return pd.Timestamp(os.path.getmtime(_path(ticker)), unit="s", tz="UTC")
+
+def get_version():
+    """Dataversion för prisdatabasen i den här processen; ändras när ny data sparas."""
+    if EXTERNAL_INGEST:
+        mapped = get_published()
+        return mapped.version if mapped is not None else None
+    return _version
+
+def get_published():
+    """
+    Senaste matriser från ingest-processen (external-läge), eller None. När en
+    ny version publicerats mappas den och de inlästa Parquet-filerna glöms.
+    """
+    global _mapped, _mapped_checked
+    now = time.time()
+    if _mapped is not None and now - _mapped_checked < MAPPED_CHECK_SECONDS:
+        return _mapped
+    _mapped_checked = now
+    version = price_matrix.current_version(MATRIX_DIR)
+    if version is not None and (_mapped is None or _mapped.version != version):
+        _mapped = price_matrix.open_version(MATRIX_DIR, version)
+        _frames.clear()
+    return _mapped
+
+def _save(ticker, df):
+    global _version
+    os.makedirs(PRICE_DIR, exist_ok=True)
+    path = _path(ticker)
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+    _stored_dates[ticker] = df.index[-2:]
+    if ticker in _frames:
+        _frames[ticker] = df
+    _version += 1
+
+def _clean(df):
+    df = df.reindex(columns=PRICE_FIELDS).dropna(how="all")
+    if df.index.tz is not None:
+        df.index = df.index.tz_localize(None)
+    df.index = df.index.normalize()
+    df.index.name = "Date"
+    return df.astype(float)
+
+def _download(tickers, start, failures):
+    frames = {}
+    for ticker, df in providers.get_provider().download(tickers, start, failures).items():
+        df = _clean(df)
+        if not df.empty:
+            frames[ticker] = df
+    return frames
+
+def get_failures():
+    """Tickers vars senaste hämtning misslyckades: ticker -> (orsak, tidpunkt)."""
+    return dict(_failures)
+
+def update_prices(tickers, force=False):
+    """Hämtar saknade staplar för tickers och lägger till dem i prisdatabasen."""
+    if EXTERNAL_INGEST:
+        # Ingest-processen hämtar; här kontrolleras bara om en ny version publicerats
+        get_published()
+        return
+    now = time.time()
+    # Senaste handelsdag vars stängning (med marginal för publiceringen) har passerat
+    session, closed_at = last_closed_session(CLOSE_DELAY_MINUTES)
+    market_open = is_market_open()
+    groups = {}
+    for ticker in tickers:
+        with _check_lock:
+            # Tickers som en annan tråd just hämtar hoppas över; den sparade datan används
+            if not force and now - _last_checked.get(ticker, 0) < REFRESH_INTERVAL:
+                continue
+            _last_checked[ticker] = now
+        dates = _tail_dates(ticker)
+        if dates.empty:
+            start = HISTORY_START
+        elif not force and not market_open and session is not None \
+                and dates[-1] >= session and _saved_at(ticker) >= closed_at:
+            # Stapeln för senaste avslutade handelsdagen sparades efter stängningen och
+            # är slutgiltig; dagens stapel hämtas bara om medan börsen har öppet
+            continue
+        else:
+            # Hämta om senaste sparade stapeln (den kan ha sparats under handelsdagen)
+            # och stapeln före, som jämförs med den sparade (se _rebased)
+            start = dates[0].strftime("%Y-%m-%d")
+        groups.setdefault(start, []).append(ticker)
+
+    rebased = []
+
+    for start, group in groups.items():
+        metrics.count("upstream_requests_total", provider=providers.get_provider().name)
+        metrics.count("upstream_tickers_total", len(group), provider=providers.get_provider().name)
+        failures = {}
+        with metrics.span("download"):
+            new_data = _download(group, start, failures)
+        failed = []
+        for ticker in group:
+            if ticker not in new_data:
+                # Försöks igen efter REFRESH_INTERVAL; övriga tickers sparas som vanligt
+                _failures[ticker] = (failures.get(ticker, "ingen data"), pd.Timestamp.now(tz="UTC"))
+                failed.append(ticker)
+                continue
+            _failures.pop(ticker, None)
+            history = load_history(ticker, keep=False)
+            new = new_data[ticker]
+            if history.empty:
+                merged = new
+            elif _rebased(history, new):
+                rebased.append(ticker)
+                continue
+            else:
+                merged = pd.concat([history[history.index < new.index[0]], new])
+            _save(ticker, merged)
+        if failed:
+            metrics.count("upstream_failures_total", len(failed), provider=providers.get_provider().name)
+            print(f"❌ {len(failed)} av {len(group)} tickers kunde inte hämtas: {', '.join(failed[:10])}"
+                  + (" ..." if len(failed) > 10 else ""))
+
+    if rebased:
+        # Split eller utdelning: leverantören har justerat om hela historiken
+        metrics.count("rebased_tickers_total", len(rebased), provider=providers.get_provider().name)
+        new_data = _download(rebased, HISTORY_START, {})
+        for ticker in rebased:
+            if ticker in new_data:
+                _save(ticker, new_data[ticker])
+            else:
+                _failures[ticker] = ("omjusterad historik kunde inte hämtas", pd.Timestamp.now(tz="UTC"))
+                _last_checked.pop(ticker, None)
+
+def _rebased(history, new):
+    """
+    Om de hämtade staplarna som redan fanns sparade (utom den senaste, som kan
+    ha sparats under handelsdagen) har andra Close eller Adj Close. Då har
+    leverantören justerat om historiken och den sparade går inte att förlänga.
+    """
+    overlap = new.index.intersection(history.index[:-1])
+    if overlap.empty:
+        return False
+    fields = ["Close", "Adj Close"]
+    stored = history.loc[overlap, fields].to_numpy()
+    fetched = new.loc[overlap, fields].to_numpy()
+    return not np.allclose(stored, fetched, rtol=1e-6, equal_nan=True)
+
+def _slice(df, start=None, end=None):
+    # Slutdatum är exklusivt, precis som i yf.download
+    if start is not None:
+        df = df[df.index >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df.index < pd.Timestamp(end)]
+    return df
+
+def get_history(ticker, start=None, end=None, adjusted=False, refresh=True):
+    """
+    Returnerar OHLCV-historik för en ticker mellan start och end (exklusivt).
+    Med adjusted=True ersätts Close av Adj Close (motsvarar auto_adjust=True).
+    """
+    if refresh:
+        update_prices([ticker])
+    # Kopia så att anroparen kan lägga till kolumner utan att påverka cachen
+    df = _slice(load_history(ticker), start, end).copy()
+    if adjusted:
+        df = df.drop(columns="Close").rename(columns={"Adj Close": "Close"})
+    return df
+
+def get_field_matrix(tickers, field="Close", start=None, end=None, refresh=True):
+    """Returnerar ett fält (t.ex. Close) som matris: datum × tickers."""
+    if refresh:
+        update_prices(tickers)
+    if EXTERNAL_INGEST:
+        mapped = get_published()
+        if mapped is not None and mapped.has(field):
+            # Skrivskyddad vy över de delade matriserna
+            return mapped.matrix(tickers, field, start, end)
+    columns = {}
+    for ticker in tickers:
+        history = load_fields(ticker, [field])
+        if not history.empty:
+            columns[ticker] = history[field]
+    if not columns:
+        return pd.DataFrame(columns=tickers, dtype=float)
+    matrix = pd.concat(columns, axis=1)
+    return _slice(matrix, start, end)
+
+def get_panel(tickers, fields=("Close",), start=None, end=None, refresh=True):
+    """
+    Kompakt float32-panel med bara de efterfrågade fälten (se modules/panel.py).
+    Bara fälten läses från filerna; hela historikerna hålls inte i minnet.
+    """
+    if refresh:
+        update_prices(tickers)
+    fields = tuple(fields)
+    if EXTERNAL_INGEST:
+        mapped = get_published()
+        if mapped is not None and all(mapped.has(field) for field in fields) \
+                and all(ticker in mapped.columns for ticker in tickers):
+            return PricePanel.from_mapped(mapped, tickers, fields, start, end)
+    frames = {ticker: load_fields(ticker, fields) for ticker in tickers}
+    return PricePanel.from_frames(frames, tickers, fields, start, end)
@@ -0,0 +1,405 @@
+import os
+import json
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+# --------------------------------------------------
+# Marknadsdata-leverantörer
+# --------------------------------------------------
+# All extern data (kurser, fondinnehav och indexmedlemmar) hämtas via en
+# leverantör. Yahoo är standard; replay läser sparade filer och synthetic
+# genererar deterministiska kurser, så att sidorna kan köras och mätas helt
+# offline och reproducerbart. Leverantören väljs med MARKETBREADTH_PROVIDER
+# (yahoo, replay eller synthetic).
+
+PROVIDER_NAME = os.environ.get("MARKETBREADTH_PROVIDER", "yahoo").lower()
+PRICE_FIELDS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+HOLDINGS_COLUMNS = ["Symbol", "Name", "Weight"]
+
+def _file_name(ticker):
+    # "^VIX" fungerar inte bra som filnamn överallt
+    return ticker.replace("^", "_")
+
+class MarketDataProvider:
+    """Gränssnitt som price_store, constituents och sidorna använder."""
+
+    name = "base"
+
+    def download(self, tickers, start, failures=None):
+        """
+        OHLCV från start för tickers: dict ticker -> DataFrame (Date-index, PRICE_FIELDS).
+        Tickers som inte kunde hämtas läggs i failures (ticker -> orsak) om det anges.
+        """
+        raise NotImplementedError
+
+    def holdings(self, ticker):
+        """Fondinnehav som DataFrame med HOLDINGS_COLUMNS (vikt i procent), eller None."""
+        raise NotImplementedError
+
+    def index_members(self, index="sp500"):
+        """Tickers i ett index (i Yahoo-format, t.ex. BRK-B)."""
+        raise NotImplementedError
+
+    def intraday(self, tickers, start):
+        """
+        Minutstaplar från start (naiv tid i New York) för dagens handel:
+        dict ticker -> DataFrame (tidsindex, Open/High/Low/Close/Volume).
+        Leverantörer utan minutdata har inget liveläge.
+        """
+        raise NotImplementedError
+
+#############################
+# Yahoo Finance (och Wikipedia för indexlistan)
+#############################
+
+class YahooProvider(MarketDataProvider):
+    """
+    Universumet delas i block som hämtas parallellt (begränsat antal trådar)
+    över en gemensam HTTP-session. Block som misslyckas hämtas om med ökande
+    väntetid; tickers som saknas i ett block som lyckades hämtas sedan en och
+    en. Block som misslyckas helt rapporteras som fel för alla sina tickers.
+    Ett enskilt fel stoppar alltså inte resten av nedladdningen.
+    """
+
+    name = "yahoo"
+    CHUNK_SIZE = 50         # Tickers per anrop till yf.download
+    MAX_WORKERS = 8         # Samtidiga block
+    RETRIES = 3             # Försök per block och per enskild ticker
+    BACKOFF_SECONDS = 1.0   # Väntetid före andra försöket, fördubblas sedan
+
+    def __init__(self):
+        self._session = None
+
+    def _get_session(self):
+        # En session (anslutningar och cookies) för alla trådar
+        if self._session is None:
+            from curl_cffi import requests as curl_requests
+            self._session = curl_requests.Session(impersonate="chrome")
+        return self._session
+
+    def _attempt(self, func, *args):
+        # (resultat, None) eller (None, felorsak) efter RETRIES försök med ökande väntetid
+        for attempt in range(self.RETRIES):
+            try:
+                return func(*args), None
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            if attempt < self.RETRIES - 1:
+                time.sleep(self.BACKOFF_SECONDS * 2 ** attempt)
+        return None, error
+
+    def _download_chunk(self, chunk, start, interval="1d"):
+        raw = yf.download(chunk, start=start, interval=interval, group_by="ticker", auto_adjust=False,
+                          progress=False, threads=False, session=self._get_session())
+        frames = {}
+        for ticker in chunk:
+            df = None
+            if not raw.empty:
+                if isinstance(raw.columns, pd.MultiIndex):
+                    if ticker in raw.columns.get_level_values(0):
+                        df = raw[ticker]
+                else:
+                    df = raw
+            if df is not None and not df.dropna(how="all").empty:
+                frames[ticker] = df
+        if not frames and interval == "1d":
+            # Inget alls i svaret: behandlas som ett fel så att blocket hämtas om. För
+            # minutstaplar är ett tomt block normalt (före öppning, efter stängning,
+            # handelsstopp) och räknas som lyckat utan staplar
+            raise RuntimeError("tomt svar")
+        return frames
+
+    def _download_single(self, ticker, start):
+        df = yf.Ticker(ticker, session=self._get_session()).history(start=start, auto_adjust=False)
+        if df.empty:
+            raise RuntimeError("ingen data")
+        return df
+
+    def _fetch(self, tickers, start, failures=None, interval="1d", single_fallback=True):
+        chunks = [tickers[i:i + self.CHUNK_SIZE] for i in range(0, len(tickers), self.CHUNK_SIZE)]
+        frames = {}
+        missing = []
+        with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, max(len(chunks), 1))) as pool:
+            results = pool.map(lambda chunk: self._attempt(self._download_chunk, chunk, start, interval), chunks)
+            for chunk, (result, error) in zip(chunks, results):
+                if result is None:
+                    # Hela blocket misslyckades (oftast begränsning av antal anrop): att
+                    # fråga efter varje ticker för sig skulle bara ge fler avslag
+                    if failures is not None:
+                        failures.update(dict.fromkeys(chunk, error))
+                    continue
+                frames.update(result)
+                missing += [ticker for ticker in chunk if ticker not in result]
+            if not single_fallback:
+                return frames
+            # Tickers som saknas i ett block som i övrigt lyckades (t.ex. BITO ibland)
+            # hämtas en och en
+            results = pool.map(lambda ticker: self._attempt(self._download_single, ticker, start), missing)
+            for ticker, (df, error) in zip(missing, results):
+                if df is not None:
+                    frames[ticker] = df
+                elif failures is not None:
+                    failures[ticker] = error
+        return frames
+
+    def download(self, tickers, start, failures=None):
+        return self._fetch(tickers, start, failures)
+
+    def intraday(self, tickers, start):
+        # Tickers utan nya staplar saknas bara i svaret; de hämtas inte en och en
+        frames = self._fetch(tickers, pd.Timestamp(start).tz_localize("America/New_York"),
+                             interval="1m", single_fallback=False)
+        for ticker, df in frames.items():
+            if df.index.tz is not None:
+                df.index = df.index.tz_convert("America/New_York").tz_localize(None)
+        return frames
+
+    def holdings(self, ticker):
+        # funds_data.top_holdings ger bara de tio största innehaven
+        t = yf.Ticker(ticker)
+        try:
+            top = t.funds_data.top_holdings
+        except Exception:
+            top = None
+        if top is not None and not top.empty:
+            return pd.DataFrame({
+                "Symbol": top.index.astype(str),
+                "Name": top.get("Name", pd.Series("", index=top.index)).to_numpy(),
+                "Weight": top.get("Holding Percent", pd.Series(np.nan, index=top.index)).to_numpy() * 100,
+            })
+        # Äldre yfinance-versioner
+        holdings = getattr(t, "holdings", None)
+        if holdings is None:
+            holdings = getattr(t, "fund_holdings", None)
+        if holdings is None or holdings.empty:
+            return None
+        symbol_column = next((c for c in ("Symbol", "Ticker") if c in holdings.columns), holdings.columns[0])
+        return pd.DataFrame({"Symbol": holdings[symbol_column].astype(str).to_numpy(),
+                             "Name": "", "Weight": np.nan})
+
+    def index_members(self, index="sp500"):
+        if index != "sp500":
+            raise ValueError(f"Okänt index: {index}")
+        url = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
+        tables = pd.read_html(url)
+        df = tables[0]
+        tickers = df['Symbol'].tolist()
+        # Omvandla t.ex. BRK.B till BRK-B (anpassat för Yahoo Finance)
+        return [ticker.replace('.', '-') for ticker in tickers]
+
+#############################
+# Replay: sparade filer
+#############################
+# Katalogstruktur:
+#   prices/<TICKER>.parquet (eller .csv) med Date-index och PRICE_FIELDS
+#   holdings/<TICKER>.csv med HOLDINGS_COLUMNS
+#   constituents/<index>.json med {"tickers": [...]} (samma format som data/constituents)
+#   intraday/<TICKER>.parquet med minutstaplar (valfritt, för liveläget)
+
+class ReplayProvider(MarketDataProvider):
+    name = "replay"
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _read_prices(self, ticker):
+        base = os.path.join(self.directory, "prices", _file_name(ticker))
+        if os.path.exists(base + ".parquet"):
+            return pd.read_parquet(base + ".parquet")
+        if os.path.exists(base + ".csv"):
+            return pd.read_csv(base + ".csv", index_col="Date", parse_dates=["Date"])
+        return None
+
+    def download(self, tickers, start, failures=None):
+        frames = {}
+        for ticker in tickers:
+            df = self._read_prices(ticker)
+            if df is None:
+                if failures is not None:
+                    failures[ticker] = "saknas i replay-katalogen"
+                continue
+            df = df[df.index >= pd.Timestamp(start)]
+            if not df.empty:
+                frames[ticker] = df
+        return frames
+
+    def holdings(self, ticker):
+        path = os.path.join(self.directory, "holdings", f"{_file_name(ticker)}.csv")
+        if not os.path.exists(path):
+            return None
+        return pd.read_csv(path).reindex(columns=HOLDINGS_COLUMNS)
+
+    def index_members(self, index="sp500"):
+        with open(os.path.join(self.directory, "constituents", f"{index}.json")) as f:
+            return json.load(f)["tickers"]
+
+    def intraday(self, tickers, start):
+        # intraday/<TICKER>.parquet med minutstaplar (naiv tid i New York)
+        frames = {}
+        for ticker in tickers:
+            path = os.path.join(self.directory, "intraday", f"{_file_name(ticker)}.parquet")
+            if os.path.exists(path):
+                df = pd.read_parquet(path)
+                df = df[df.index >= pd.Timestamp(start)]
+                if not df.empty:
+                    frames[ticker] = df
+        return frames
+
+def record_replay(directory, tickers, start, provider=None, index="sp500", holdings=()):
+    """Sparar kurser, innehav och indexlista från en leverantör som replay-filer."""
+    provider = provider or get_provider()
+    for sub in ("prices", "holdings", "constituents"):
+        os.makedirs(os.path.join(directory, sub), exist_ok=True)
+    for ticker, df in provider.download(list(tickers), start).items():
+        df.to_parquet(os.path.join(directory, "prices", f"{_file_name(ticker)}.parquet"))
+    for ticker in holdings:
+        table = provider.holdings(ticker)
+        if table is not None:
+            table.to_csv(os.path.join(directory, "holdings", f"{_file_name(ticker)}.csv"), index=False)
+    with open(os.path.join(directory, "constituents", f"{index}.json"), "w") as f:
+        json.dump({"index": index, "tickers": provider.index_members(index)}, f)
+
+#############################
+# Synthetic: deterministiska genererade kurser
+#############################
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    Slumpvandring per ticker, seedad från tickernamnet, så att samma ticker och
+    datum alltid ger samma stapel oavsett startdatum. Universumet består av
+    n_tickers påhittade aktier; alla andra namn (QQQ, ^VIX, sektor-ETF:er)
+    genereras också. years begränsar hur lång historik som lämnas ut.
+    """
+
+    name = "synthetic"
+    ORIGIN = "1995-01-02"   # Fast startpunkt för alla serier
+
+    def __init__(self, n_tickers=500, years=20, seed=0):
+        self.n_tickers = n_tickers
+        self.years = years
+        self.seed = seed
+
+    def _rng(self, ticker, stream=0):
+        # En egen slumpström per fält, så att värdet för ett datum inte beror
+        # på hur många dagar som genereras
+        return np.random.default_rng([self.seed, zlib.crc32(ticker.encode()), stream])
+
+    def _series(self, ticker, dates):
+        n = len(dates)
+        rng = self._rng(ticker)
+        drift, vol = rng.uniform(-0.0001, 0.0006), rng.uniform(0.008, 0.03)
+        price, adjustment = rng.uniform(10, 300), rng.uniform(0.9, 1.0)
+        # Vissa aktier noteras senare, för realistiska luckor i början
+        listed = int(rng.integers(0, 5000)) if rng.random() < 0.2 else 0
+        steps = self._rng(ticker, 1).normal(drift, vol, n)
+        if ticker.startswith("^"):
+            # Index som VIX: återgår mot en nivå i stället för att trenda
+            level = np.empty(n)
+            level[0] = 18.0
+            for i in range(1, n):
+                level[i] = level[i - 1] + 0.05 * (18.0 - level[i - 1]) + level[i - 1] * steps[i] * 3
+            close = np.maximum(level, 5.0)
+        else:
+            close = price * np.exp(np.cumsum(steps))
+        open_ = np.concatenate([[close[0]], close[:-1]]) * (1 + self._rng(ticker, 2).normal(0, vol / 4, n))
+        frame = pd.DataFrame({
+            "Open": open_,
+            "High": np.maximum(open_, close) * (1 + np.abs(self._rng(ticker, 3).normal(0, vol / 2, n))),
+            "Low": np.minimum(open_, close) * (1 - np.abs(self._rng(ticker, 4).normal(0, vol / 2, n))),
+            "Close": close,
+            "Adj Close": close * adjustment,
+            "Volume": np.round(self._rng(ticker, 5).lognormal(13, 1, n)),
+        }, index=dates)
+        return frame.iloc[listed:]
+
+    def download(self, tickers, start, failures=None):
+        today = pd.Timestamp.today().normalize()
+        first = max(pd.Timestamp(start), today - pd.DateOffset(years=self.years))
+        # Vardagar (utan helgdagar); samma datum för alla tickers i anropet
+        dates = pd.DatetimeIndex(np.arange(np.datetime64(self.ORIGIN), np.datetime64(today.date()) + 1,
+                                           dtype="datetime64[D]"), name="Date")
+        dates = dates[dates.dayofweek < 5]
+        frames = {}
+        for ticker in tickers:
+            df = self._series(ticker, dates)
+            df = df[df.index >= first]
+            if not df.empty:
+                frames[ticker] = df
+        return frames
+
+    def index_members(self, index="sp500"):
+        return [f"SYN{i:04d}" for i in range(self.n_tickers)]
+
+    SESSION_MINUTES = 390   # 09:30-16:00
+
+    def intraday(self, tickers, start):
+        # Minutstaplar som går från föregående dags stängning till dagens dagliga
+        # stängning (brownsk brygga), fram till aktuell minut i New York
+        start = pd.Timestamp(start)
+        day = start.normalize()
+        opening = day + pd.Timedelta(hours=9, minutes=30)
+        now = pd.Timestamp.now(tz="America/New_York").tz_localize(None)
+        elapsed = int(np.clip((now - opening) / pd.Timedelta(minutes=1) + 1, 0, self.SESSION_MINUTES))
+        if elapsed == 0:
+            return {}
+        times = opening + pd.to_timedelta(np.arange(elapsed), unit="min")
+        daily = self.download(tickers, day - pd.Timedelta(days=7))
+        frames = {}
+        for ticker, df in daily.items():
+            if df.index[-1] != day or len(df) < 2:
+                continue
+            previous, close = df["Close"].iloc[-2], df["Close"].iloc[-1]
+            rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode()), int(day.value // 86400e9)])
+            walk = np.cumsum(rng.normal(0, 1, self.SESSION_MINUTES))
+            t = np.arange(1, self.SESSION_MINUTES + 1) / self.SESSION_MINUTES
+            bridge = walk - t * walk[-1]
+            log_path = np.log(previous) + t * np.log(close / previous) + bridge * 0.001
+            path = np.exp(log_path[:elapsed])
+            bars = pd.DataFrame({"Open": np.concatenate([[previous], path[:-1]]), "High": path, "Low": path,
+                                 "Close": path, "Volume": 1000.0}, index=times)
+            bars = bars[bars.index >= start]
+            if not bars.empty:
+                frames[ticker] = bars
+        return frames
+
+    def holdings(self, ticker):
+        rng = self._rng(ticker)
+        members = self.index_members()
+        symbols = rng.choice(members, size=min(10, len(members)), replace=False)
+        weights = np.sort(rng.dirichlet(np.ones(len(symbols))))[::-1] * 60
+        return pd.DataFrame({"Symbol": symbols, "Name": [f"{s} Inc" for s in symbols],
+                             "Weight": np.round(weights, 2)})
+
+#############################
+# Aktiv leverantör
+#############################
+
+_provider = None
+
+def _from_environment():
+    if PROVIDER_NAME == "replay":
+        return ReplayProvider(os.environ.get("MARKETBREADTH_REPLAY_DIR", "replay"))
+    if PROVIDER_NAME == "synthetic":
+        return SyntheticProvider(
+            n_tickers=int(os.environ.get("MARKETBREADTH_SYNTHETIC_TICKERS", 500)),
+            years=int(os.environ.get("MARKETBREADTH_SYNTHETIC_YEARS", 20)),
+            seed=int(os.environ.get("MARKETBREADTH_SYNTHETIC_SEED", 0)),
+        )
+    if PROVIDER_NAME != "yahoo":
+        raise ValueError(f"Okänd leverantör: {PROVIDER_NAME}")
+    return YahooProvider()
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        _provider = _from_environment()
+    return _provider
+
+def set_provider(provider):
+    """Byter leverantör i processen (t.ex. i benchmarks)."""
+    global _provider
+    _provider = provider
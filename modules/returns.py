@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+from modules import metrics, price_store, universes
+from modules.trading_calendar import INTERVAL_DAYS, get_trading_calendar
+
+# --------------------------------------------------
+# Avkastning för alla intervall i en beräkning
+# --------------------------------------------------
+# Från en prismatris (datum × tickers) som täcker minst 12M räknas
+# avkastningen för 1D/1V/1M/3M/6M/12M ut för alla tickers samtidigt.
+# Resultatet cachas per universum och dataversion, så att byte av intervall
+# bara blir en uppslagning och en sortering. Stora universum räknas i block
+# om universes.CHUNK_TICKERS tickers; avkastningen per ticker beror inte på
+# de andra, så blocken slås bara ihop.
+
+_cache = {}  # (namn, fält, krav på hel period) -> (version, tabell)
+
+def _valid_positions(values):
+    # För varje rad och kolumn: närmaste rad framåt/bakåt med ett giltigt pris
+    n_rows = values.shape[0]
+    rows = np.arange(n_rows)[:, None]
+    valid = ~np.isnan(values)
+    next_valid = np.where(valid, rows, n_rows)
+    next_valid = np.minimum.accumulate(next_valid[::-1], axis=0)[::-1]
+    prev_valid = np.where(valid, rows, -1)
+    prev_valid = np.maximum.accumulate(prev_valid, axis=0)
+    return next_valid, prev_valid
+
+def compute_interval_returns(closes, calendar, require_full_period=False):
+    """
+    Avkastning i procent per ticker (rader) och intervall (kolumner).
+    Startpris är första giltiga pris i intervallet och slutpris det sista.
+    Med require_full_period=True hoppas tickers vars första pris ligger efter
+    intervallets startdatum över (regeln från sektorsidan). Startpris 0 ger NaN.
+    """
+    intervals = list(INTERVAL_DAYS)
+    result = pd.DataFrame(np.nan, index=closes.columns, columns=intervals)
+    if closes.empty:
+        return result
+
+    # float32 från prispanelen räcker för avkastning i procent med två decimaler
+    values = closes.to_numpy()
+    next_valid, prev_valid = _valid_positions(values)
+    n_rows = values.shape[0]
+    columns = np.arange(values.shape[1])
+
+    bounds = [calendar.interval_dates(interval) for interval in intervals]
+    usable = [k for k, b in enumerate(bounds) if b is not None]
+    starts = np.array([bounds[k][0] for k in usable], dtype="datetime64[ns]")
+    ends = np.array([bounds[k][1] for k in usable], dtype="datetime64[ns]")
+    dates = closes.index.to_numpy(dtype="datetime64[ns]")
+    start_rows = np.searchsorted(dates, starts, side="left")
+    end_rows = np.searchsorted(dates, ends, side="left") - 1
+
+    # Alla intervall på en gång: (intervall × tickers)
+    first = next_valid[np.minimum(start_rows, n_rows - 1)]
+    # 1D: föregående stängning som i liveläget, dvs. senaste giltiga pris till och med startdagen
+    one_day = np.array([intervals[k] == "1D" for k in usable])
+    if one_day.any():
+        start_last = np.searchsorted(dates, starts, side="right") - 1
+        previous = prev_valid[np.maximum(start_last, 0)]
+        first = np.where((one_day & (start_last >= 0))[:, None] & (previous >= 0), previous, first)
+    last = prev_valid[np.maximum(end_rows, 0)]
+    ok = (start_rows < n_rows)[:, None] & (end_rows >= 0)[:, None] & (first <= end_rows[:, None]) & (last >= 0)
+    if one_day.any():
+        # Före dagens stapel (t.ex. före öppning) finns ingen 1D-avkastning än
+        ok &= ~one_day[:, None] | (last > first)
+    first = np.where(ok, first, 0)
+    last = np.where(ok, last, 0)
+    start_price = values[first, columns]
+    end_price = values[last, columns]
+    if require_full_period:
+        ok &= dates[first] <= starts[:, None]
+    ok &= start_price != 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret = np.where(ok, (end_price - start_price) / start_price * 100, np.nan)
+    result.iloc[:, usable] = ret.T
+    return result
+
+def get_returns_table(name, tickers, field="Close", require_full_period=False, universe_version=None):
+    """
+    Avkastningstabell (tickers × intervall) för ett universum, cachad per dataversion.
+    universe_version (t.ex. från constituents) används som nyckel för tickerlistan;
+    annars används listan själv.
+    """
+    calendar = get_trading_calendar()
+    start_dates = [b[0] for b in map(calendar.interval_dates, INTERVAL_DAYS) if b is not None]
+    start = min(start_dates) if start_dates else None
+    blocks = universes.chunks(tickers)
+    for block in blocks:
+        price_store.update_prices(block)
+    universe_key = universe_version if universe_version is not None else tuple(tickers)
+    version = (price_store.get_version(), str(calendar.last_session()), universe_key)
+    key = (name, field, require_full_period)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == version:
+        metrics.count("cache_requests_total", cache="returns", universe=name, result="hit")
+        return cached[1]
+    metrics.count("cache_requests_total", cache="returns", universe=name, result="miss")
+    parts = []
+    for block in blocks:
+        with metrics.span("load"):
+            panel = price_store.get_panel(block, [field], start=start, refresh=False)
+        with metrics.span("compute"):
+            parts.append(compute_interval_returns(panel.frame(field), calendar, require_full_period))
+    if not parts:
+        # Tomt universum (t.ex. en tom fil)
+        table = pd.DataFrame(columns=list(INTERVAL_DAYS), dtype=float)
+    else:
+        table = parts[0] if len(parts) == 1 else pd.concat(parts)
+    _cache[key] = (version, table)
+    return table
+
+def top_n(table, interval, n=50):
+    """De n tickers med högst avkastning för ett intervall, som Series (ticker -> %)."""
+    return table[interval].dropna().nlargest(n)
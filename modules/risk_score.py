@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+from modules import datagraph, price_store
+from modules.constituents import get_sp500_tickers
+
+# --------------------------------------------------
+# Risk Score: alla komponenter som daglig historik
+# --------------------------------------------------
+# Varje komponent räknas som en tidsserie från prisdatabasen (vektoriserat över
+# alla tickers som behövs), så att risknivån och trösklarna 80/50 kan följas
+# bakåt i tiden. Hela historiken räknas om på någon sekund, en gång per
+# dataversion, via den delade beroendegrafen.
+
+RISK_ON_LEVEL = 80
+NEUTRAL_LEVEL = 50
+VIX_THRESHOLD = 20
+BREAKOUT_WINDOW = 20          # Utbrott = stängning över högsta stängning senaste 20 dagarna
+RS_WINDOW = 63                # ~3 månader för relativ styrka
+TREND_SLOPE_DAYS = 20         # MA50 stigande jämfört med 20 dagar sedan
+SECTOR_MA = 50
+
+# Maxpoäng per komponent (summa 98)
+COMPONENT_WEIGHTS = {
+    "Market Sentiment": 30,   # QQQ:s marknadsfas och långsiktiga trend
+    "Breakout": 20,           # Andel utbrott av utbrott + sammanbrott bland S&P 500-aktier
+    "Relative Strength": 10,  # Offensiva sektorer (XLK, XLY) slår defensiva (XLU, XLP)
+    "SMA50": 10,              # Andel S&P 500-aktier över MA50
+    "SMA Trend": 15,          # QQQ över MA50, MA50 över MA200 och MA50 stigande
+    "Sector": 10,             # Andel av de elva SPDR-sektorerna över MA50
+    "QQQ": 1,                 # QQQ över MA200
+    "VIX": 1,                 # VIX under VIX_THRESHOLD
+    "NH/NL": 1,               # Fler nya 52-veckors toppar än bottnar
+}
+
+SECTOR_ETFS = ["XLK", "XLF", "XLE", "XLV", "XLI", "XLB", "XLU", "XLP", "XLY", "XLC", "XLRE"]
+OFFENSIVE = ["XLK", "XLY"]
+DEFENSIVE = ["XLU", "XLP"]
+
+def _sentiment_series(qqq):
+    # Uppåtfas och bull ger 30, nedåtfas och bear 0, annars 15 (för varje dag)
+    bull = qqq["LongTermTrend"] == "bull"
+    score = pd.Series(15.0, index=qqq.index)
+    score[(qqq["MarketPhase"] == "uptrend") & bull] = 30.0
+    score[(qqq["MarketPhase"] == "downtrend") & ~bull] = 0.0
+    return score.where(qqq["MarketPhase"] != "undefined")
+
+def _breakout_share(member_closes):
+    # Utbrott/sammanbrott mot föregående dagars högsta/lägsta stängning
+    prior_high = member_closes.rolling(window=BREAKOUT_WINDOW).max().shift(1)
+    prior_low = member_closes.rolling(window=BREAKOUT_WINDOW).min().shift(1)
+    breakouts = (member_closes > prior_high).sum(axis=1)
+    breakdowns = (member_closes < prior_low).sum(axis=1)
+    total = breakouts + breakdowns
+    # Dagar utan varken utbrott eller sammanbrott räknas som neutrala
+    return (breakouts / total.where(total > 0)).fillna(0.5).where(prior_high.notna().any(axis=1))
+
+def _share_above_ma(closes, window):
+    ma = closes.rolling(window=window).mean()
+    counted = ma.notna().sum(axis=1)
+    return (closes > ma).sum(axis=1) / counted.where(counted > 0)
+
+def compute_risk_components(qqq, etfs, member_closes, breadth):
+    """
+    Daglig poäng per komponent och total Risk Score.
+    qqq:           QQQ med Close, Adj Close, LongTermTrend och MarketPhase (Date-index)
+    etfs:          Adj Close för QQQ, ^VIX och sektor-ETF:erna (datum × tickers)
+    member_closes: Close för S&P 500-medlemmarna (datum × tickers)
+    breadth:       breddtabellen från modules.breadth
+    """
+    index = qqq.index
+    weights = COMPONENT_WEIGHTS
+    etfs = etfs.reindex(index).ffill()
+    components = pd.DataFrame(index=index)
+    components["Market Sentiment"] = _sentiment_series(qqq)
+
+    breakout = _breakout_share(member_closes).reindex(index).ffill()
+    components["Breakout"] = weights["Breakout"] * breakout
+
+    offensive = etfs.reindex(columns=OFFENSIVE).pct_change(RS_WINDOW, fill_method=None).mean(axis=1)
+    defensive = etfs.reindex(columns=DEFENSIVE).pct_change(RS_WINDOW, fill_method=None).mean(axis=1)
+    components["Relative Strength"] = (weights["Relative Strength"] * (offensive > defensive)) \
+        .where(offensive.notna() & defensive.notna())
+
+    components["SMA50"] = weights["SMA50"] * breadth["Above MA50 (%)"].reindex(index).ffill() / 100
+
+    qqq_close = qqq["Adj Close"]
+    ma50 = qqq_close.rolling(window=50).mean()
+    ma200 = qqq_close.rolling(window=200).mean()
+    trend_checks = pd.concat([qqq_close > ma50, ma50 > ma200, ma50 > ma50.shift(TREND_SLOPE_DAYS)], axis=1)
+    components["SMA Trend"] = (weights["SMA Trend"] * trend_checks.mean(axis=1)).where(ma200.notna())
+
+    components["Sector"] = weights["Sector"] * _share_above_ma(etfs.reindex(columns=SECTOR_ETFS), SECTOR_MA)
+
+    components["QQQ"] = (qqq_close > ma200).astype(int).where(ma200.notna())
+    if "^VIX" in etfs.columns and etfs["^VIX"].notna().any():
+        components["VIX"] = (etfs["^VIX"] < VIX_THRESHOLD).astype(int).where(etfs["^VIX"].notna())
+    else:
+        components["VIX"] = 0
+    nh_nl = (breadth["New Highs"] > breadth["New Lows"]).astype(int)
+    components["NH/NL"] = nh_nl.reindex(index).ffill()
+
+    # Historiken börjar när QQQ har en fullständig MA200 och en definierad fas
+    components = components[ma200.notna() & components["Market Sentiment"].notna()]
+    components = components.fillna(0)
+    components["Risk Score"] = components[list(weights)].sum(axis=1)
+    return components
+
+#############################
+# Noder i den delade beroendegrafen
+#############################
+
+@datagraph.node("risk_etfs", tickers=["QQQ", "^VIX"] + SECTOR_ETFS)
+def _risk_etfs():
+    return price_store.get_field_matrix(["QQQ", "^VIX"] + SECTOR_ETFS, "Adj Close", refresh=False)
+
+@datagraph.node("risk_components", depends=["qqq_phase", "risk_etfs", "sp500_closes", "sp500_breadth"])
+def _risk_components(qqq, etfs, member_closes, breadth):
+    return compute_risk_components(qqq, etfs, member_closes, breadth)
+
+def get_risk_score():
+    """Risk Score-historik för S&P 500/QQQ, beräknad en gång per dataversion."""
+    return datagraph.get("risk_components")
+
+#############################
+# Risk Score under handelsdagen (liveläget)
+#############################
+
+def _tail_sum(series, n):
+    # Summan av de n senaste värdena, NaN om något saknas (som rolling(n + 1) med dagens pris)
+    tail = series.iloc[-n:]
+    return float(tail.sum()) if len(tail) == n and tail.notna().all() else np.nan
+
+class IntradayRisk:
+    """
+    Risk Score med livepriser, som mottagare i modules.live. Allt som bara
+    beror på kurserna före i dag (högsta/lägsta stängning, summor för
+    glidande medelvärden, priser 63 dagar bakåt) räknas en gång per dag; ett
+    nytt pris ändrar sedan bara räknarna för den tickern. Market Sentiment och
+    NH/NL (fas och 52-veckors toppar behöver dagsstaplar) följer med från
+    senaste dagliga raden.
+    """
+
+    def __init__(self):
+        self.ready = False
+
+    def tickers(self):
+        return get_sp500_tickers() + ["QQQ", "^VIX"] + SECTOR_ETFS
+
+    def rebuild(self, day):
+        components = get_risk_score()
+        components = components[components.index < day]
+        etfs = datagraph.get("risk_etfs")
+        etfs = etfs[etfs.index < day].ffill()
+        members = datagraph.get("sp500_closes")
+        members = members[members.index < day]
+        if components.empty or len(etfs) < 200 or len(members) < SECTOR_MA:
+            self.ready = False
+            return
+        self.carry = components.iloc[-1].to_dict()
+        self.average = components["Risk Score"].iloc[-252:].mean()
+
+        # S&P 500-medlemmar: utbrottsgränser och MA50-summor per kolumn
+        values = members.to_numpy(dtype=float)
+        self.columns = {ticker: i for i, ticker in enumerate(members.columns)}
+        window = values[-BREAKOUT_WINDOW:]
+        complete = ~np.isnan(window).any(axis=0)
+        self.prior_high = np.where(complete, np.nanmax(window, axis=0, initial=-np.inf), np.nan)
+        self.prior_low = np.where(complete, np.nanmin(window, axis=0, initial=np.inf), np.nan)
+        tail = values[-(SECTOR_MA - 1):]
+        self.ma_defined = ~np.isnan(tail).any(axis=0)
+        self.ma_sums = np.where(self.ma_defined, np.nansum(tail, axis=0), np.nan)
+        self.breakout = np.zeros(len(self.columns), dtype=bool)
+        self.breakdown = np.zeros(len(self.columns), dtype=bool)
+        self.above = np.zeros(len(self.columns), dtype=bool)
+        self._set_members(np.arange(len(self.columns)), values[-1])
+        self.n_breakouts, self.n_breakdowns = int(self.breakout.sum()), int(self.breakdown.sum())
+        self.n_above = int(self.above.sum())
+
+        # ETF:er: summor för MA50/MA200 utan dagens pris och senaste stängning som utgångspris
+        self.etf_sums = {ticker: (_tail_sum(etfs[ticker], SECTOR_MA - 1), _tail_sum(etfs[ticker], 199))
+                         for ticker in etfs.columns}
+        self.rs_start = etfs.iloc[-RS_WINDOW] if len(etfs) >= RS_WINDOW else pd.Series(dtype=float)
+        self.qqq_ma50_before = etfs["QQQ"].rolling(window=50).mean().iloc[-TREND_SLOPE_DAYS]
+        self.prices = etfs.iloc[-1].to_dict()
+        # Minutpriserna är ojusterade; skalas med senaste dagens kvot Adj Close / Close
+        closes = price_store.get_field_matrix(list(etfs.columns), "Close", end=day, refresh=False)
+        ratio = etfs.iloc[-1] / closes.ffill().iloc[-1].reindex(etfs.columns)
+        self.scale = ratio.where(np.isfinite(ratio) & (ratio > 0), 1.0).to_dict()
+        self.ready = True
+
+    def _set_members(self, positions, prices):
+        with np.errstate(invalid="ignore"):
+            self.breakout[positions] = prices > self.prior_high[positions]
+            self.breakdown[positions] = prices < self.prior_low[positions]
+            self.above[positions] = self.ma_defined[positions] & (prices > (self.ma_sums[positions] + prices) / SECTOR_MA)
+
+    def update(self, prices):
+        if not self.ready:
+            return
+        changed = [(self.columns[t], p) for t, p in prices.items() if t in self.columns]
+        if changed:
+            positions = np.fromiter((c for c, _ in changed), dtype=np.intp, count=len(changed))
+            values = np.fromiter((p for _, p in changed), dtype=float, count=len(changed))
+            # Räknarna justeras med skillnaden för de ändrade tickers
+            before = (self.breakout[positions].sum(), self.breakdown[positions].sum(), self.above[positions].sum())
+            self._set_members(positions, values)
+            self.n_breakouts += int(self.breakout[positions].sum() - before[0])
+            self.n_breakdowns += int(self.breakdown[positions].sum() - before[1])
+            self.n_above += int(self.above[positions].sum() - before[2])
+        for ticker, price in prices.items():
+            if ticker in self.prices:
+                self.prices[ticker] = price * self.scale[ticker]
+
+    def _ma(self, ticker, window):
+        sum49, sum199 = self.etf_sums[ticker]
+        return ((sum49 if window == 50 else sum199) + self.prices[ticker]) / window
+
+    def components(self):
+        """Poäng per komponent och total Risk Score (Series) med aktuella priser, eller None."""
+        if not self.ready:
+            return None
+        weights = COMPONENT_WEIGHTS
+        result = dict.fromkeys(weights, 0.0)
+        result["Market Sentiment"] = self.carry["Market Sentiment"]
+        result["NH/NL"] = self.carry["NH/NL"]
+
+        total = self.n_breakouts + self.n_breakdowns
+        result["Breakout"] = weights["Breakout"] * (self.n_breakouts / total if total else 0.5)
+        counted = int(self.ma_defined.sum())
+        result["SMA50"] = weights["SMA50"] * self.n_above / counted if counted else 0.0
+
+        def change(ticker):
+            start = self.rs_start.get(ticker, np.nan)
+            return self.prices.get(ticker, np.nan) / start - 1
+        offensive = np.nanmean([change(t) for t in OFFENSIVE]) if len(self.rs_start) else np.nan
+        defensive = np.nanmean([change(t) for t in DEFENSIVE]) if len(self.rs_start) else np.nan
+        if not (np.isnan(offensive) or np.isnan(defensive)):
+            result["Relative Strength"] = weights["Relative Strength"] * (offensive > defensive)
+
+        if "QQQ" in self.etf_sums and not np.isnan(self.etf_sums["QQQ"][1]):
+            qqq = self.prices["QQQ"]
+            ma50, ma200 = self._ma("QQQ", 50), self._ma("QQQ", 200)
+            result["SMA Trend"] = weights["SMA Trend"] * np.mean([qqq > ma50, ma50 > ma200, ma50 > self.qqq_ma50_before])
+            result["QQQ"] = int(qqq > ma200)
+
+        sectors = [t for t in SECTOR_ETFS if t in self.etf_sums and not np.isnan(self.etf_sums[t][0])
+                   and not np.isnan(self.prices.get(t, np.nan))]
+        if sectors:
+            result["Sector"] = weights["Sector"] * np.mean([self.prices[t] > self._ma(t, 50) for t in sectors])
+        vix = self.prices.get("^VIX", np.nan)
+        result["VIX"] = int(vix < VIX_THRESHOLD) if not np.isnan(vix) else 0
+        result["Risk Score"] = sum(result[name] for name in weights)
+        return pd.Series(result)
+
+def risk_regime(score):
+    """Text och färger för en risknivå enligt trösklarna 80/50."""
+    if score >= RISK_ON_LEVEL:
+        return "Risk On: Invest Full", "white", "#006400"
+    if score >= NEUTRAL_LEVEL:
+        return "Neutral: Moderate Exposure", "black", "#FFD700"
+    return "Risk Off: Hold Cash", "white", "#8B0000"
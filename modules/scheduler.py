@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+import pandas as pd
+from modules import metrics
+from modules.trading_calendar import last_closed_session
+
+# --------------------------------------------------
+# Bakgrundsuppdatering av data och figurer
+# --------------------------------------------------
+# Sidmodulerna registrerar jobb (namn -> funktion). En bakgrundstråd kör alla
+# jobb med jämna mellanrum och direkt efter NYSE-stängning, och sparar
+# resultaten så att callbacks kan svara direkt med färdiga figurer.
+# En pågående uppdatering blockerar aldrig användarnas anrop.
+
+REFRESH_MINUTES = int(os.environ.get("MARKETBREADTH_REFRESH_MINUTES", "60"))
+CLOSE_DELAY_MINUTES = 20   # Vänta efter stängning så att dagens staplar hunnit publiceras
+CHECK_SECONDS = 60         # Hur ofta tråden kontrollerar om det är dags
+
+_jobs = {}                 # namn -> funktion utan argument
+_results = {}              # namn -> senaste resultat
+_refresh_lock = threading.Lock()
+_thread = None
+_last_refresh = None       # pd.Timestamp (UTC) då senaste uppdateringen blev klar
+
+def register_job(name, func):
+    _jobs[name] = func
+
+def get_result(name):
+    """Senaste förberäknade resultat för ett jobb, eller None om det saknas."""
+    result = _results.get(name)
+    metrics.count("cache_requests_total", cache="scheduler", result="miss" if result is None else "hit")
+    return result
+
+def last_refresh():
+    return _last_refresh
+
+def is_running():
+    return _refresh_lock.locked()
+
+def _latest_close():
+    # Senaste NYSE-stängning (UTC) som redan passerat, inklusive förkortade dagar
+    return last_closed_session(CLOSE_DELAY_MINUTES)[1]
+
+def is_due(last):
+    """Om en uppdatering ska köras: aldrig körd, REFRESH_MINUTES sedan last eller en stängning sedan last."""
+    if last is None:
+        return True
+    now = pd.Timestamp.now(tz="UTC")
+    if now - last >= pd.Timedelta(minutes=REFRESH_MINUTES):
+        return True
+    latest_close = _latest_close()
+    return latest_close is not None and last < latest_close
+
+def run_jobs():
+    """Kör alla registrerade jobb. Returnerar False om en uppdatering redan pågår."""
+    global _last_refresh
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    try:
+        for name, func in list(_jobs.items()):
+            started = time.perf_counter()
+            try:
+                _results[name] = func()
+            except Exception as e:
+                metrics.inc("job_errors_total", job=name)
+                print(f"❌ Bakgrundsjobbet {name} misslyckades: {e}")
+            metrics.observe("job_seconds", time.perf_counter() - started, job=name)
+        _last_refresh = pd.Timestamp.now(tz="UTC")
+    finally:
+        _refresh_lock.release()
+    return True
+
+def _loop():
+    while True:
+        try:
+            if is_due(_last_refresh):
+                run_jobs()
+        except Exception as e:
+            print(f"❌ Fel i bakgrundsschemaläggaren: {e}")
+        time.sleep(CHECK_SECONDS)
+
+def start():
+    """Startar bakgrundstråden (en gång per process)."""
+    global _thread
+    if _thread is not None:
+        return
+    _thread = threading.Thread(target=_loop, name="marketbreadth-scheduler", daemon=True)
+    _thread.start()
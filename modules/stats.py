@@ -4,3 +4,6 @@ layout = html.Div([
     html.H3("Statistik - Kommer snart"),
     html.P("Här kommer vi att analysera historisk data och korrelationer.")
 ])
+
+def get_layout():
+    return layout
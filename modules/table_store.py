@@ -0,0 +1,45 @@
+import os
+import json
+import tempfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+from modules import price_store
+
+# --------------------------------------------------
+# Sparade tabeller med tillstånd (bredd, indikatorer, faser)
+# --------------------------------------------------
+# Tabellen och dess metadata (tillstånd, schemaversion, ...) skrivs som en
+# enda Parquet-fil med metadata i filens schema. Filen skrivs under ett unikt
+# temporärt namn i samma katalog och byts sedan atomiskt, så en läsare ser
+# alltid en hel tabell med tillhörande tillstånd, även när flera processer
+# skriver samtidigt. Med en separat ingest-process (MARKETBREADTH_INGEST=external)
+# skriver bara ingest-processen; webbprocesserna läser.
+
+META_KEY = b"marketbreadth"
+
+def load(path):
+    """(tabell, metadata) från path, eller (None, None) om filen saknas eller saknar metadata."""
+    if not os.path.exists(path):
+        return None, None
+    table = pq.read_table(path)
+    meta = (table.schema.metadata or {}).get(META_KEY)
+    if meta is None:
+        return None, None   # Äldre format med separat JSON-fil: byggs om
+    return table.to_pandas(), json.loads(meta)
+
+def save(path, table, meta):
+    """Sparar tabell och metadata atomiskt. Gör ingenting i webbprocesser i external-läge."""
+    if price_store.EXTERNAL_INGEST:
+        return
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    arrow = pa.Table.from_pandas(table)
+    arrow = arrow.replace_schema_metadata({**(arrow.schema.metadata or {}), META_KEY: json.dumps(meta).encode()})
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pq.write_table(arrow, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
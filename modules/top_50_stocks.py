@@ -1,124 +1,114 @@
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output
-import yfinance as yf
+from dash.dependencies import Input, Output, State
 import pandas as pd
 import plotly.express as px
 from pandas.tseries.offsets import BDay  # För att räkna handelsdagar
-import pandas_market_calendars as mcal  # För att få exakta handelsdagar för NYSE
+from modules import figure_cache, live, metrics, returns, scheduler, universes
 
 # --------------------------------------------------
-# Hämta S&P 500-tickers genom att skrapa Wikipedia
+# Funktion: Hämta avkastning för ett universum (standard S&P 500)
 # --------------------------------------------------
-def get_sp500_tickers():
-    url = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
-    tables = pd.read_html(url)
-    df = tables[0]
-    tickers = df['Symbol'].tolist()
-    # Omvandla t.ex. BRK.B till BRK-B (anpassat för Yahoo Finance)
-    tickers = [ticker.replace('.', '-') for ticker in tickers]
-    return tickers
-
-SP500_TICKERS = get_sp500_tickers()
-print(f"Hämtade {len(SP500_TICKERS)} tickers från S&P 500.")
+def fetch_top_stocks_data(interval="6M", universe="sp500", n=50):
+    # Avkastning för alla intervall beräknas samtidigt (i block för stora
+    # universum) och cachas per dataversion
+    table = returns.get_returns_table(universe, universes.get_universe(universe), "Close",
+                                      universe_version=universes.universe_version(universe))
+    top = returns.top_n(table, interval, n)
+    if top.empty:
+        print("❌ Ingen data hämtades!")
+        return pd.DataFrame(columns=["Ticker", "Return (%)"])
+    return pd.DataFrame({"Ticker": top.index, "Return (%)": top.values})
 
 # --------------------------------------------------
-# Definiera tidsintervaller (samma som i sector leaders)
+# Anpassad färgskala: Blått (låga värden) -> Grönt (höga värden)
 # --------------------------------------------------
-INTERVAL_DAYS = {
-    "1D": 1,
-    "1V": 5,    # 1 vecka = 5 handelsdagar
-    "1M": 21,
-    "3M": 63,
-    "6M": 126,
-    "12M": 252
-}
+custom_color_scale = ["#0000FF", "#007FFF", "#00BFFF", "#00FF00"]
 
-# --------------------------------------------------
-# Hämta NYSE-handelskalender
-# --------------------------------------------------
-nyse = mcal.get_calendar("NYSE")
+DEFAULT_UNIVERSE = "sp500"   # Har liveläge och byggs i förväg av bakgrundsjobbet
+
+def _label(universe):
+    return "SPY" if universe == DEFAULT_UNIVERSE else universe
 
 # --------------------------------------------------
-# Funktion: Hämta data och beräkna avkastning för S&P 500-aktier
+# Funktion: Bygg stapeldiagrammet för ett intervall
 # --------------------------------------------------
-def fetch_top_stocks_data(interval="6M"):
-    print(f"\n📥 Hämtar top stocks data för {interval} från Yahoo Finance...")
-    today = pd.Timestamp.today()
-    all_trading_days = nyse.valid_days(start_date="2020-01-01", end_date=today)
-    
-    # Bestäm start- och slutdatum beroende på intervallet
-    if interval == "1V":
-        # Hitta den senaste fredagen (weekday == 4)
-        friday_date = None
-        for d in reversed(all_trading_days):
-            if d.weekday() == 4:
-                friday_date = d
-                break
-        if friday_date is None:
-            print("❌ Kunde inte hitta en fredag.")
-            return pd.DataFrame(columns=["Ticker", "Return (%)"])
-        week_number = friday_date.isocalendar()[1]
-        year = friday_date.year
-        week_trading_days = [d for d in all_trading_days if d.isocalendar()[1] == week_number and d.year == year]
-        monday_date = min(week_trading_days)
-        start_date = monday_date.strftime("%Y-%m-%d")
-        # Eftersom yfinance inte inkluderar slutdatumet, lägg till en dag efter fredagen
-        end_date = (friday_date + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
-        print(f"📅 För 1V: Måndag: {start_date}, Fredag: {end_date}")
-    else:
-        if len(all_trading_days) < INTERVAL_DAYS[interval]:
-            print("❌ Inte tillräckligt med handelsdagar!")
-            return pd.DataFrame(columns=["Ticker", "Return (%)"])
-        start_date = all_trading_days[-INTERVAL_DAYS[interval]].strftime("%Y-%m-%d")
-        end_date = (all_trading_days[-1] + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
-        print(f"📅 Start: {start_date}, Slut: {end_date}")
-    
-    # Ladda ner data för alla S&P 500-aktier
-    data = yf.download(SP500_TICKERS, start=start_date, end=end_date, group_by='ticker', auto_adjust=False)
-    if data.empty:
-        print("❌ Ingen data hämtades!")
-        return pd.DataFrame(columns=["Ticker", "Return (%)"])
-    
-    returns = {}
-    for ticker in SP500_TICKERS:
+def create_top_stocks_figure(interval, universe=DEFAULT_UNIVERSE):
+    with metrics.span("fetch"):
+        top50 = fetch_top_stocks_data(interval, universe)
+    if top50.empty:
+        return px.bar(title="Ingen data tillgänglig")
+    with metrics.span("render"):
+        return _top_stocks_bar(top50, universe)
+
+def _top_stocks_bar(top50, universe=DEFAULT_UNIVERSE):
+    fig = px.bar(
+        top50, 
+        x="Ticker", 
+        y="Return (%)", 
+        text="Return (%)", 
+        color="Return (%)",
+        color_continuous_scale=custom_color_scale,
+        title=f"Top 50 Stocks ({_label(universe)})"
+    )
+    fig.update_traces(texttemplate="%{text:.2f}%", textposition="outside")
+    fig.update_layout(xaxis_tickangle=-45, clickmode="event")
+    return fig
+
+# Serialiserade figurer per intervall och dataversion; bakgrundsjobbet bygger
+# alla intervall i förväg
+figure_cache.register_figure("top_50_stocks", create_top_stocks_figure,
+                             tickers=lambda: universes.get_universe(DEFAULT_UNIVERSE))
+scheduler.register_job("top_50_stocks", lambda: figure_cache.warm("top_50_stocks"))
+
+_universe_pages = set()
+
+def _page(universe):
+    # Övriga universum får en egen sida i figurcachen. Den byggs bara av
+    # bakgrundsjobbet nedan: ett stort universum (t.ex. russell3000) tar minuter
+    if universe == DEFAULT_UNIVERSE:
+        return "top_50_stocks"
+    page = f"top_50_stocks-{universe}"
+    if page not in _universe_pages:
+        figure_cache.register_figure(page, lambda interval: create_top_stocks_figure(interval, universe),
+                                     version=lambda: universes.universe_version(universe), prebuilt=True)
+        _universe_pages.add(page)
+    return page
+
+def _other_universes():
+    return [u for u in universes.list_universes() if u != DEFAULT_UNIVERSE]
+
+def warm_universes():
+    """Bygger figurerna för alla universum utom S&P 500 (bakgrundsjobb)."""
+    for universe in _other_universes():
         try:
-            ticker_data = data[ticker]
+            figure_cache.warm(_page(universe))
         except Exception as e:
-            print(f"⚠️ Ingen data för {ticker}: {e}")
-            continue
-        if ticker_data.empty:
-            continue
-        if "Close" not in ticker_data.columns:
-            continue
-        series = ticker_data["Close"].dropna()
-        if series.empty:
-            continue
-        start_price = series.iloc[0]
-        end_price = series.iloc[-1]
-        if start_price == 0:
-            continue
-        ret = (end_price - start_price) / start_price * 100
-        returns[ticker] = ret
-    if not returns:
-        return pd.DataFrame(columns=["Ticker", "Return (%)"])
-    df = pd.DataFrame({"Ticker": list(returns.keys()), "Return (%)": list(returns.values())})
-    df.sort_values("Return (%)", ascending=False, inplace=True)
-    top50 = df.head(50)
-    print("📊 Top 50 aktier:\n", top50)
-    return top50
+            print(f"❌ Top 50 för {universe} kunde inte byggas: {e}")
 
-# --------------------------------------------------
-# Anpassad färgskala: Blått (låga värden) -> Grönt (höga värden)
-# --------------------------------------------------
-custom_color_scale = ["#0000FF", "#007FFF", "#00BFFF", "#00FF00"]
+scheduler.register_job("top_50_universes", warm_universes)
+
+# Liveläget: avkastning med minutpriser för de intervall som slutar i dag
+live.register("sp500", live.LiveUniverse(lambda: universes.get_universe("sp500")))
+
+def _live_bar(state):
+    return _top_stocks_bar(pd.DataFrame({"Ticker": state["tickers"], "Return (%)": state["values"]}))
+
+def _daily_figure(interval, universe=DEFAULT_UNIVERSE):
+    fig = figure_cache.get_figure(_page(universe), interval)
+    if fig is None:
+        return px.bar(title=f"Top 50 för {universe} beräknas i bakgrunden, försök igen om en stund")
+    return fig
 
 # --------------------------------------------------
 # Bygg Dash-layouten för Top 50 Stocks
 # --------------------------------------------------
 # OBS: Vi använder ett unikt id "selected-interval-top-stocks" här
 layout = html.Div([
-    html.H1("Top 50 Stocks (SPY)", style={"textAlign": "center"}),
+    html.H1("Top 50 Stocks", style={"textAlign": "center"}),
+    html.Div([
+        dcc.Dropdown(id="top-stocks-universe", value=DEFAULT_UNIVERSE, clearable=False)
+    ], style={"width": "250px", "margin": "0 auto"}),
     html.Div([
         html.Button("1D", id="btn-1D", n_clicks=0, style={"margin": "5px"}),
         html.Button("1V", id="btn-1V", n_clicks=0, style={"margin": "5px"}),
@@ -132,53 +122,75 @@ layout = html.Div([
         id="loading-graph",
         type="default",
         children=[dcc.Graph(id="top-stocks-graph")]
-    )
+    ),
+    # Liveläget: nya minutpriser hämtas med jämna mellanrum och skickas som Patch
+    dcc.Interval(id="top-stocks-live", interval=live.LIVE_SECONDS * 1000, disabled=not live.LIVE),
+    dcc.Store(id="top-stocks-live-state")
 ])
 
+def get_layout():
+    # Universum kan läggas till som filer medan servern kör
+    layout["top-stocks-universe"].options = universes.list_universes()
+    return layout
+
 # --------------------------------------------------
 # Callback: Registrera callbacks med en funktion
 # --------------------------------------------------
 def register_callbacks(app):
     @app.callback(
         [Output("top-stocks-graph", "figure"),
-         Output("selected-interval-top-stocks", "children")],
+         Output("selected-interval-top-stocks", "children"),
+         Output("top-stocks-live-state", "data")],
         [Input("btn-1D", "n_clicks"),
          Input("btn-1V", "n_clicks"),
          Input("btn-1M", "n_clicks"),
          Input("btn-3M", "n_clicks"),
          Input("btn-6M", "n_clicks"),
-         Input("btn-12M", "n_clicks")],
+         Input("btn-12M", "n_clicks"),
+         Input("top-stocks-universe", "value")],
+        [State("top-stocks-live-state", "data")],
         allow_duplicate=True
     )
-    def update_top_stocks(n1, n1V, n1M, n3M, n6M, n12M):
+    @metrics.instrument("update_top_stocks")
+    def update_top_stocks(n1, n1V, n1M, n3M, n6M, n12M, universe, state):
         ctx = dash.callback_context
-        if not ctx.triggered:
-            interval = "6M"
-        else:
-            interval = ctx.triggered[0]["prop_id"].split(".")[0].replace("btn-", "")
-        
-        top50 = fetch_top_stocks_data(interval)
-        if top50.empty:
-            fig = px.bar(title="Ingen data tillgänglig")
+        trigger = ctx.triggered[0]["prop_id"].split(".")[0] if ctx.triggered else None
+        if trigger is not None and trigger.startswith("btn-"):
+            interval = trigger.replace("btn-", "")
         else:
-            fig = px.bar(
-                top50, 
-                x="Ticker", 
-                y="Return (%)", 
-                text="Return (%)", 
-                color="Return (%)",
-                color_continuous_scale=custom_color_scale,
-                title="Top 50 Stocks (SPY)"
-            )
-            fig.update_traces(texttemplate="%{text:.2f}%", textposition="outside")
-            fig.update_layout(xaxis_tickangle=-45, clickmode="event")
-        return fig, f"Valt intervall: {interval}"
+            # Nytt universum: samma intervall som tidigare
+            interval = (state or {}).get("interval", "6M")
+        if universe not in universes.list_universes():
+            universe = DEFAULT_UNIVERSE
+
+        if universe == DEFAULT_UNIVERSE:
+            view = live.bar_view("sp500", interval, 50, _live_bar)
+            if view is not None:
+                fig, state = view
+                return fig, f"Valt intervall: {interval}", state
+        return (_daily_figure(interval, universe), f"Valt intervall: {interval}",
+                {"interval": interval, "tick": None, "universe": universe})
+
+    @app.callback(
+        [Output("top-stocks-graph", "figure", allow_duplicate=True),
+         Output("top-stocks-live-state", "data", allow_duplicate=True)],
+        [Input("top-stocks-live", "n_intervals")],
+        [State("top-stocks-live-state", "data")],
+        prevent_initial_call=True
+    )
+    @metrics.instrument("patch_top_stocks")
+    def patch_top_stocks(n_intervals, state):
+        # Bara ändrade staplar skickas; inget alls om inga nya priser kommit.
+        # Liveläget finns bara för S&P 500
+        if state and state.get("universe", DEFAULT_UNIVERSE) != DEFAULT_UNIVERSE:
+            return dash.no_update, dash.no_update
+        return live.bar_refresh("sp500", state, 50, _live_bar, _daily_figure)
 
 # --------------------------------------------------
 # Om modulen körs direkt (standalone)
 # --------------------------------------------------
 if __name__ == "__main__":
     app = dash.Dash(__name__)
-    app.layout = layout
+    app.layout = get_layout()
     register_callbacks(app)
     app.run_server(debug=True)
@@ -0,0 +1,105 @@
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import pandas_market_calendars as mcal
+
+# --------------------------------------------------
+# Handelsdagsintervall (gemensamma för alla sidor)
+# --------------------------------------------------
+INTERVAL_DAYS = {
+    "1D": 1,
+    "1V": 5,    # 1 vecka = 5 handelsdagar
+    "1M": 21,
+    "3M": 63,
+    "6M": 126,
+    "12M": 252
+}
+
+CALENDAR_START = "2020-01-01"
+
+# --------------------------------------------------
+# NYSE-handelskalender, skapas först när den behövs
+# --------------------------------------------------
+@lru_cache(maxsize=1)
+def get_nyse_calendar():
+    return mcal.get_calendar("NYSE")
+
+def _group_starts(keys):
+    # För varje dag: positionen för första dagen i samma grupp (t.ex. vecka)
+    positions = np.arange(len(keys))
+    is_start = np.r_[True, keys[1:] != keys[:-1]] if len(keys) else np.array([], dtype=bool)
+    return np.maximum.accumulate(np.where(is_start, positions, 0))
+
+class TradingCalendar:
+    """
+    Handelsdagar för NYSE med förberäknade vecko- och månadsindex, så att
+    start- och slutdatum för varje intervall slås upp direkt i arrayer.
+    """
+
+    def __init__(self, trading_days):
+        self.days = trading_days
+        self.weekday = trading_days.weekday.to_numpy()
+        # Vecka = (kalenderår, ISO-vecka), samma gruppering som tidigare 1V-logik
+        week_key = trading_days.year.to_numpy() * 100 + trading_days.isocalendar().week.to_numpy()
+        month_key = trading_days.year.to_numpy() * 100 + trading_days.month.to_numpy()
+        self.week_start = _group_starts(week_key)
+        self.month_start = _group_starts(month_key)
+        fridays = np.flatnonzero(self.weekday == 4)
+        self.last_friday = fridays[-1] if len(fridays) else None
+
+    def last_session(self):
+        return self.days[-1].tz_localize(None) if len(self.days) else None
+
+    def interval_dates(self, interval):
+        """
+        Returnerar (start_date, end_date) som "YYYY-MM-DD" för ett intervall i
+        INTERVAL_DAYS, eller None om det inte finns tillräckligt med handelsdagar.
+        end_date är dagen efter sista handelsdagen (yfinance exkluderar slutdatumet).
+        1D börjar på föregående handelsdag, så att startpriset är dess stängning
+        (samma startpris som liveläget använder).
+        """
+        if interval == "1V":
+            # Måndag (första handelsdagen) till och med fredag i senaste hela veckan
+            if self.last_friday is None:
+                return None
+            start = self.days[self.week_start[self.last_friday]]
+            end = self.days[self.last_friday]
+        else:
+            n = INTERVAL_DAYS[interval] + (1 if interval == "1D" else 0)
+            if len(self.days) < n:
+                return None
+            start = self.days[-n]
+            end = self.days[-1]
+        return start.strftime("%Y-%m-%d"), (end + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+
+@lru_cache(maxsize=1)
+def _recent_schedule(day):
+    # Öppning och stängning (UTC) för handelsdagarna de senaste två veckorna
+    return get_nyse_calendar().schedule(start_date=pd.Timestamp(day) - pd.Timedelta(days=14), end_date=day)
+
+def last_closed_session(delay_minutes=0, now=None):
+    """
+    (handelsdag, stängningstid i UTC) för senaste handelsdagen vars stängning
+    plus delay_minutes har passerat, eller (None, None).
+    """
+    now = pd.Timestamp.now(tz="UTC") if now is None else now
+    closes = _recent_schedule(now.strftime("%Y-%m-%d"))["market_close"] + pd.Timedelta(minutes=delay_minutes)
+    closes = closes[closes <= now]
+    if closes.empty:
+        return None, None
+    return closes.index[-1], closes.iloc[-1]
+
+def is_market_open(now=None):
+    """Om NYSE har öppet just nu (förkortade dagar inräknade)."""
+    now = pd.Timestamp.now(tz="UTC") if now is None else now
+    schedule = _recent_schedule(now.strftime("%Y-%m-%d"))
+    return bool(((schedule["market_open"] <= now) & (now < schedule["market_close"])).any())
+
+@lru_cache(maxsize=1)
+def _build_calendar(day):
+    trading_days = get_nyse_calendar().valid_days(start_date=CALENDAR_START, end_date=day)
+    return TradingCalendar(trading_days)
+
+def get_trading_calendar():
+    """Handelskalendern byggs en gång per dag och återanvänds sedan."""
+    return _build_calendar(pd.Timestamp.today().strftime("%Y-%m-%d"))
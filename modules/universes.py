@@ -0,0 +1,86 @@
+import os
+import json
+import hashlib
+import pandas as pd
+from modules import constituents
+
+# --------------------------------------------------
+# Universum: namngivna tickerlistor
+# --------------------------------------------------
+# Utöver de inbyggda universumen (sp500 från constituents och de som sidorna
+# registrerar, t.ex. sectors) läses listor från filer i UNIVERSE_DIR:
+#
+#   universes/russell1000.csv     kolumnen Symbol eller Ticker (annars första kolumnen)
+#   universes/nasdaq100.txt       en ticker per rad, # inleder kommentar
+#   universes/watchlist.json      {"tickers": [...]} (samma format som data/constituents)
+#
+# Filnamnet (utan ändelse) är universumets namn. Tickers skrivs om till
+# Yahoo-format (BRK.B -> BRK-B). Stora universum (t.ex. Russell 3000) räknas i
+# block om CHUNK_TICKERS, se returns.get_returns_table och breadth.update_universe_breadth.
+
+UNIVERSE_DIR = os.environ.get(
+    "MARKETBREADTH_UNIVERSE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "universes")
+)
+CHUNK_TICKERS = 500   # Tickers per block; begränsar minnet för stora universum
+FILE_TYPES = (".csv", ".txt", ".json")
+
+_builtin = {"sp500": constituents.get_sp500_tickers}   # namn -> funktion som returnerar tickers
+_files = {}   # sökväg -> (ändringstid, tickers)
+
+def register(name, tickers):
+    """Registrerar ett inbyggt universum; tickers är en lista eller en funktion som returnerar en."""
+    _builtin[name] = tickers if callable(tickers) else (lambda: list(tickers))
+
+def _normalize(tickers):
+    cleaned = (str(t).strip().upper().replace(".", "-") for t in tickers)
+    return list(dict.fromkeys(t for t in cleaned if t and t != "NAN"))
+
+def _read_file(path):
+    if path.endswith(".json"):
+        with open(path) as f:
+            return json.load(f)["tickers"]
+    if path.endswith(".csv"):
+        df = pd.read_csv(path)
+        column = next((c for c in df.columns if str(c).strip().lower() in ("symbol", "ticker")), df.columns[0])
+        return df[column].tolist()
+    with open(path) as f:
+        return [line.split("#")[0] for line in f]
+
+def _file_path(name):
+    for extension in FILE_TYPES:
+        path = os.path.join(UNIVERSE_DIR, name + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+def list_universes():
+    """Namn på alla tillgängliga universum."""
+    names = list(_builtin)
+    if os.path.isdir(UNIVERSE_DIR):
+        names += sorted(os.path.splitext(f)[0] for f in os.listdir(UNIVERSE_DIR) if f.endswith(FILE_TYPES))
+    return list(dict.fromkeys(names))
+
+def get_universe(name):
+    """Tickers i ett universum. Filer läses om när de ändrats."""
+    if name in _builtin:
+        return list(_builtin[name]())
+    path = _file_path(name)
+    if path is None:
+        raise KeyError(f"Okänt universum: {name}")
+    mtime = os.path.getmtime(path)
+    cached = _files.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _files[path] = (mtime, _normalize(_read_file(path)))
+    return list(cached[1])
+
+def universe_version(name):
+    """Version för tickerlistan, att använda som cachenyckel."""
+    if name == "sp500":
+        return constituents.universe_version()
+    tickers = get_universe(name)
+    return f"{name}-{len(tickers)}-" + hashlib.sha1(",".join(tickers).encode()).hexdigest()[:8]
+
+def chunks(tickers, size=CHUNK_TICKERS):
+    """Tickers i block om size."""
+    return [tickers[i:i + size] for i in range(0, len(tickers), size)]
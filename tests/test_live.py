@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from modules import live, price_store, returns
+from modules.panel import PricePanel
+from modules.trading_calendar import TradingCalendar
+
+# --------------------------------------------------
+# Liveläget och den dagliga beräkningen ska ge samma 1D vid stängning
+# --------------------------------------------------
+
+def _closes(days, tickers):
+    rng = np.random.default_rng(0)
+    steps = rng.normal(0, 0.02, (len(days), len(tickers)))
+    closes = pd.DataFrame(100 * np.exp(np.cumsum(steps, axis=0)), index=days.tz_localize(None), columns=tickers)
+    closes.iloc[-2, 1] = np.nan   # Saknad stapel föregående dag: senaste giltiga pris används
+    return closes
+
+def test_live_and_daily_1d_agree_at_close(monkeypatch):
+    days = pd.bdate_range("2025-01-02", periods=300, tz="UTC")
+    tickers = ["AAA", "BBB", "CCC", "DDD"]
+    closes = _closes(days, tickers)
+    calendar = TradingCalendar(days)
+
+    def get_panel(tickers, fields=("Close",), start=None, end=None, refresh=True):
+        frames = {t: closes[[t]].rename(columns={t: "Close"}).dropna() for t in tickers}
+        return PricePanel.from_frames(frames, tickers, fields, start, end)
+
+    monkeypatch.setattr(live, "get_trading_calendar", lambda: calendar)
+    monkeypatch.setattr(price_store, "get_panel", get_panel)
+
+    daily = returns.compute_interval_returns(closes, calendar)["1D"]
+    universe = live.LiveUniverse(tickers)
+    universe.rebuild(closes.index[-1])
+    universe.update(closes.iloc[-1].to_dict())
+    intraday = universe.top("1D")
+
+    assert (daily.abs() > 0).all()
+    expected = closes.ffill().iloc[-1] / closes.ffill().iloc[-2] * 100 - 100
+    np.testing.assert_allclose(daily[tickers], expected[tickers], rtol=1e-5)
+    np.testing.assert_allclose(intraday[tickers], daily[tickers], rtol=1e-5)
+
+def test_1d_starts_at_previous_session():
+    days = pd.bdate_range("2025-01-02", periods=10, tz="UTC")
+    start, end = TradingCalendar(days).interval_dates("1D")
+    assert start == days[-2].strftime("%Y-%m-%d")
+    assert end == (days[-1] + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+
+def test_daily_1d_missing_before_todays_bar():
+    days = pd.bdate_range("2025-01-02", periods=300, tz="UTC")
+    closes = _closes(days, ["AAA", "BBB"]).iloc[:-1]   # Kalendern har i dag, priserna inte än
+    daily = returns.compute_interval_returns(closes, TradingCalendar(days))["1D"]
+    assert daily.isna().all()